@@ -8,30 +8,543 @@ import socket
 from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
+from functools import lru_cache
+import ipaddress
+import re
+import ctypes
+
+@lru_cache(maxsize=4096)
+def parse_ip_address(text):
+    """解析IP地址，返回 (版本, 整数值)；格式无效时返回 None"""
+    text = text.strip()
+    if ':' in text:
+        try:
+            return 6, int(ipaddress.IPv6Address(text))
+        except ValueError:
+            return None
+    parts = text.split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        # 每部分必须是0-255的数字，且不允许以0开头（如01、001）
+        if not part.isascii() or not part.isdigit() or (len(part) > 1 and part[0] == '0'):
+            return None
+        number = int(part)
+        if number > 255:
+            return None
+        value = (value << 8) | number
+    return 4, value
+
+@lru_cache(maxsize=256)
+def parse_subnet_prefix(text, version=4):
+    """解析子网掩码（如255.255.255.0）或前缀长度（如24、/64），返回前缀长度；无效时返回 None"""
+    text = text.strip().lstrip('/')
+    bits = 32 if version == 4 else 128
+    if text.isascii() and text.isdigit():
+        prefix = int(text)
+        return prefix if prefix <= bits else None
+    parsed = parse_ip_address(text)
+    if parsed is None or parsed[0] != 4 or version != 4:
+        return None
+    # 掩码取反后必须形如 0...01...1，即加1后为2的幂
+    inverted = ~parsed[1] & 0xFFFFFFFF
+    if inverted & (inverted + 1):
+        return None
+    return 32 - inverted.bit_length()
+
+def format_ip_address(version, value):
+    """将整数形式的地址格式化为字符串"""
+    if version == 4:
+        return str(ipaddress.IPv4Address(value))
+    return str(ipaddress.IPv6Address(value))
+
+class ParsedIPConfig:
+    """解析后的IP配置，地址均以整数保存"""
+    __slots__ = ("version", "ip", "prefix", "gateway", "dns", "network", "last")
+
+    def __init__(self, version, ip, prefix, gateway, dns):
+        self.version = version
+        self.ip = ip
+        self.prefix = prefix
+        self.gateway = gateway
+        self.dns = dns
+        bits = 32 if version == 4 else 128
+        host_mask = (1 << (bits - prefix)) - 1
+        self.network = ip & ~host_mask
+        self.last = self.network | host_mask
+
+    @property
+    def mask_text(self):
+        """IPv4子网掩码字符串"""
+        return format_ip_address(4, (0xFFFFFFFF << (32 - self.prefix)) & 0xFFFFFFFF)
+
+    @property
+    def network_text(self):
+        """网络地址，形如 192.168.1.0/24"""
+        return f"{format_ip_address(self.version, self.network)}/{self.prefix}"
+
+    def contains(self, value):
+        """地址（整数）是否在本子网内"""
+        return self.network <= value <= self.last
+
+@lru_cache(maxsize=4096)
+def parse_ip_config(ip, subnet, gateway="", dns=""):
+    """解析并校验一组IP配置，返回 ParsedIPConfig；无效时抛出带提示信息的 ValueError"""
+    parsed_ip = parse_ip_address(ip)
+    if parsed_ip is None:
+        raise ValueError("IP地址格式不正确！\n请输入有效的IPv4或IPv6地址，如192.168.1.100")
+    version = parsed_ip[0]
+
+    prefix = parse_subnet_prefix(subnet, version)
+    if prefix is None:
+        raise ValueError("子网掩码值无效！\n请输入标准的子网掩码（如255.255.255.0）或前缀长度（如24、64）")
+
+    gateway_value = None
+    if gateway:
+        parsed_gateway = parse_ip_address(gateway)
+        if parsed_gateway is None or parsed_gateway[0] != version:
+            raise ValueError("网关地址格式不正确！\n请输入与IP地址同类型的网关地址，如192.168.1.1")
+        gateway_value = parsed_gateway[1]
+
+    dns_value = None
+    if dns:
+        parsed_dns = parse_ip_address(dns)
+        if parsed_dns is None:
+            raise ValueError("DNS服务器地址格式不正确！\n请输入有效的DNS地址，如8.8.8.8")
+        dns_value = parsed_dns
+
+    config = ParsedIPConfig(version, parsed_ip[1], prefix, gateway_value, dns_value)
+    # IPv6允许使用链路本地地址(fe80::/10)作为网关
+    link_local = version == 6 and gateway_value is not None and gateway_value >> 118 == 0x3FA
+    if gateway_value is not None and not link_local and not config.contains(gateway_value):
+        raise ValueError("网关地址不在当前子网内！\n请检查IP地址和网关设置")
+    return config
+
+def check_ip_config(ip_config):
+    """校验配置字典（包括范围模板和DHCP配置），返回错误提示；有效时返回 None"""
+    if is_dhcp(ip_config):
+        return None if ip_config.get("name") else "配置名称不能为空！"
+    if is_template(ip_config):
+        try:
+            RangeTemplate(ip_config)
+            return None
+        except ValueError as e:
+            return str(e)
+    try:
+        parse_ip_config(ip_config.get("ip", ""), ip_config.get("subnet", ""),
+                        ip_config.get("gateway", ""), ip_config.get("dns", ""))
+        return None
+    except ValueError as e:
+        return str(e)
+
+def is_template(ip_config):
+    """是否为范围模板配置"""
+    return ip_config.get("type") == "template"
+
+def is_dhcp(ip_config):
+    """是否为DHCP配置（地址和DNS都由DHCP服务器分配）"""
+    return ip_config.get("type") == "dhcp"
+
+class RangeTemplate:
+    """范围模板：一条配置描述一段连续地址（ip 到 ip_end），其中的单个配置按需计算
+
+    name_pattern 中可使用 {n}（从1开始的序号）和 {ip}（地址）。
+    """
+    def __init__(self, entry):
+        self.entry = entry
+        self.pattern = entry.get("name_pattern") or entry["name"] + "-{n}"
+        start = parse_ip_config(entry.get("ip", ""), entry.get("subnet", ""),
+                                entry.get("gateway", ""), entry.get("dns", ""))
+        end = parse_ip_address(entry.get("ip_end", ""))
+        if end is None or end[0] != start.version:
+            raise ValueError("结束地址格式不正确！\n请输入与起始地址同类型的IP地址")
+        if end[1] < start.ip:
+            raise ValueError("结束地址不能小于起始地址！")
+        if not start.contains(end[1]):
+            raise ValueError("地址范围超出了子网！\n请检查起始地址、结束地址和子网掩码")
+        try:
+            self.pattern.format(n=1, ip="")
+        except (KeyError, IndexError, ValueError, TypeError, AttributeError):
+            raise ValueError("名称模式无效！\n只能使用 {n}（序号）和 {ip}（地址）")
+        self.version = start.version
+        self.start = start.ip
+        self.end = end[1]
+
+    def count(self):
+        """范围内的地址数量"""
+        return self.end - self.start + 1
+
+    def member(self, index):
+        """第 index 个（从0开始）地址对应的配置"""
+        ip = format_ip_address(self.version, self.start + index)
+        return {
+            "name": self.pattern.format(n=index + 1, ip=ip),
+            "ip": ip,
+            "subnet": self.entry.get("subnet", ""),
+            "gateway": self.entry.get("gateway", ""),
+            "dns": self.entry.get("dns", ""),
+            "template": self.entry["name"]
+        }
+
+    def index_of(self, ip):
+        """地址在范围内的序号，不在范围内时返回 None"""
+        parsed = parse_ip_address(ip)
+        if parsed is None or parsed[0] != self.version or not self.start <= parsed[1] <= self.end:
+            return None
+        return parsed[1] - self.start
+
+PING_RTT_PATTERN = re.compile(r'(?:time|时间)\s*[=<]\s*([\d.]+)\s*ms', re.IGNORECASE)
+
+def summarize_rtts(rtts, sent):
+    """根据每次的往返时间计算 min/p50/p95/max（毫秒）和丢包率"""
+    stats = {"sent": sent, "received": len(rtts), "loss": 1.0 if not sent else round(1 - len(rtts) / sent, 3),
+             "min": None, "p50": None, "p95": None, "max": None}
+    if rtts:
+        ordered = sorted(rtts)
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+        stats.update(min=ordered[0], p50=percentile(50), p95=percentile(95), max=ordered[-1])
+    return stats
+
+def format_latency(stats):
+    """延迟统计的显示文本"""
+    if not stats["received"]:
+        return "无应答（丢包 100%）"
+    return (f"丢包 {stats['loss']:.0%}，min/p50/p95/max = "
+            f"{stats['min']:g}/{stats['p50']:g}/{stats['p95']:g}/{stats['max']:g} ms")
+
+class CommandBackend:
+    """执行真实系统命令的后端"""
+    windows = os.name == 'nt'  # 命令使用 Windows 还是 Linux 的写法
+    live = True  # 命令会真正修改系统网络配置
+
+    def run(self, cmd):
+        """执行命令（不弹出控制台窗口）"""
+        return subprocess.run(
+            cmd,
+            shell=True,
+            capture_output=True,
+            text=True,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+
+    def spawn(self, cmd):
+        """启动命令但不等待其结束（输出丢弃）"""
+        subprocess.Popen(
+            cmd,
+            shell=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+class FakeBackend:
+    """模拟网络命令的后端：只记录命令并维护网卡状态，不修改系统配置（用于测试和演示）"""
+    live = False
+
+    def __init__(self, windows=os.name == 'nt'):
+        import threading
+        self.windows = windows
+        self.lock = threading.Lock()
+        self.commands = []
+        self.adapters = {}  # 网卡名称 -> {"ip", "prefix", "gateway"}
+
+    def run(self, cmd):
+        """模拟执行命令"""
+        with self.lock:
+            self.commands.append(cmd)
+            stdout = ""
+            returncode = 0
+            match = re.match(r'netsh interface ip set address "([^"]+)" static (\S+) (\S+) (\S+)', cmd)
+            if match:
+                adapter, ip, mask, gateway = match.groups()
+                self.adapters[adapter] = {"ip": ip, "prefix": parse_subnet_prefix(mask), "gateway": gateway}
+            match = re.match(r'netsh interface ip set address name="([^"]+)" source=dhcp', cmd)
+            if match:
+                # 模拟DHCP服务器分配的地址
+                self.adapters[match.group(1)] = {"ip": "192.168.100.10", "prefix": 24, "gateway": "192.168.100.1"}
+            match = re.search(r'ip -4 addr add (\S+)/(\d+) dev "([^"]+)"', cmd)
+            if match:
+                ip, prefix, adapter = match.groups()
+                gateway = re.search(r'route replace default via (\S+)', cmd)
+                self.adapters[adapter] = {"ip": ip, "prefix": int(prefix), "gateway": gateway.group(1) if gateway else ""}
+            match = re.match(r'netsh interface ip show config name="([^"]+)"', cmd)
+            if match and match.group(1) in self.adapters:
+                state = self.adapters[match.group(1)]
+                stdout = (f"    IP Address:                           {state['ip']}\n"
+                          f"    Subnet Prefix:                        {state['ip']}/{state['prefix']} "
+                          f"(mask {format_ip_address(4, (0xFFFFFFFF << (32 - state['prefix'])) & 0xFFFFFFFF)})\n"
+                          f"    Default Gateway:                      {state['gateway']}\n")
+            match = re.match(r'ip -4 -o addr show dev "([^"]+)"', cmd)
+            if match and match.group(1) in self.adapters:
+                state = self.adapters[match.group(1)]
+                stdout = f"2: {match.group(1)}    inet {state['ip']}/{state['prefix']} scope global {match.group(1)}\n"
+            match = re.match(r'ip -4 route show default dev "([^"]+)"', cmd)
+            if match and match.group(1) in self.adapters:
+                stdout = f"default via {self.adapters[match.group(1)]['gateway']}\n"
+            if cmd.startswith("ping"):
+                # 模拟环境中没有其他主机应答
+                returncode = 1
+            return subprocess.CompletedProcess(cmd, returncode, stdout=stdout, stderr="")
+
+    def spawn(self, cmd):
+        """模拟启动后台命令（立即完成）"""
+        return self.run(cmd)
+
+class TraceMismatchError(Exception):
+    """回放时发出的命令与跟踪文件中记录的不一致"""
+
+class TraceRecorder:
+    """记录后端执行的每条命令（输出、退出码、耗时）以及触发这些命令的操作
+
+    跟踪文件为 gzip 压缩的 JSON Lines：第一行是文件头（含会话开始时的配置），之后每行一条记录：
+    action（操作开始，含参数）、cmd（命令）、end（操作结束，含耗时和结果）、
+    config（操作开始前配置有变化时的新配置）。
+    """
+    TRACED_ACTIONS = ("apply_profile", "probe_latency", "get_network_fingerprint", "get_adapter_ip_info")
+
+    def __init__(self, backend, path):
+        import gzip
+        import itertools
+        import threading
+        import time
+        self.backend = backend
+        self.windows = backend.windows
+        self.live = backend.live
+        self.path = path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.ids = itertools.count(1)
+        self.start = time.monotonic()
+        self.app = None
+        self.last_config = None
+        self.header = {"k": "header", "version": 1, "windows": self.windows,
+                       "started": datetime.now().isoformat(timespec="seconds")}
+        # 文件头要包含应用的配置，attach 之前的记录先缓存
+        self.buffered = []
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+
+    def elapsed(self):
+        """距离开始记录的秒数"""
+        import time
+        return round(time.monotonic() - self.start, 4)
+
+    def write(self, record):
+        """写入一条记录并立即刷新，程序异常退出时也不会丢失"""
+        with self.lock:
+            if self.file is None:
+                return
+            if self.buffered is not None:
+                self.buffered.append(record)
+                return
+            self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self.file.flush()
+
+    def write_header(self, config=None):
+        """写入文件头和缓存的记录"""
+        with self.lock:
+            if self.file is None or self.buffered is None:
+                return
+            header = dict(self.header, config=config) if config is not None else self.header
+            for record in [header] + self.buffered:
+                self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self.file.flush()
+            self.buffered = None
+
+    def record_config(self):
+        """配置与上次记录的不同时写入新配置（回放时据此重现配置相关的命令）"""
+        config = json.loads(json.dumps(self.app.config, ensure_ascii=False))
+        if config != self.last_config:
+            self.last_config = config
+            self.write({"k": "config", "t": self.elapsed(), "config": config})
+
+    def run(self, cmd):
+        """执行命令并记录"""
+        import time
+        offset = self.elapsed()
+        start = time.perf_counter()
+        result = self.backend.run(cmd)
+        self.write({"k": "cmd", "a": getattr(self.local, "action", None), "t": offset, "cmd": cmd,
+                    "rc": result.returncode, "out": result.stdout or "", "err": result.stderr or "",
+                    "d": round(time.perf_counter() - start, 4)})
+        return result
+
+    def spawn(self, cmd):
+        """启动后台命令并记录（只记录启动，不记录命令的输出）"""
+        offset = self.elapsed()
+        result = self.backend.spawn(cmd)
+        self.write({"k": "cmd", "a": getattr(self.local, "action", None), "t": offset, "cmd": cmd,
+                    "rc": result.returncode, "out": "", "err": "", "d": 0, "bg": True})
+        return result
+
+    def attach(self, app):
+        """包装应用的主要操作，使其参数、结果和耗时也被记录（嵌套调用只记录最外层）"""
+        self.app = app
+        self.last_config = json.loads(json.dumps(app.config, ensure_ascii=False))
+        self.write_header(self.last_config)
+        for name in self.TRACED_ACTIONS:
+            setattr(app, name, self.wrap_action(name, getattr(app, name)))
+
+    def wrap_action(self, name, method):
+        """返回记录操作的包装函数"""
+        import time
+        def traced(*args, **kwargs):
+            if getattr(self.local, "action", None) is not None:
+                return method(*args, **kwargs)
+            import inspect
+            arguments = inspect.signature(method).bind(*args, **kwargs).arguments
+            self.record_config()
+            action_id = next(self.ids)
+            self.write({"k": "action", "id": action_id, "t": self.elapsed(), "name": name, "args": arguments})
+            self.local.action = action_id
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.local.action = None
+            self.write({"k": "end", "id": action_id, "d": round(time.perf_counter() - start, 4), "result": result})
+            return result
+        return traced
+
+    def close(self):
+        """关闭跟踪文件"""
+        self.write_header()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class ReplayBackend:
+    """按跟踪文件回放命令结果的后端，可在任意系统上离线重现现场的操作
+
+    speed 为回放速度倍数：1 按记录的耗时等待，10 表示加速10倍，0 表示不等待。
+    """
+    def __init__(self, path, speed=1.0):
+        import gzip
+        self.live = False
+        self.speed = speed
+        self.actions = []    # [{"id", "t", "name", "args", "commands": [...], "d", "result", "config"}]
+        self.unowned = 0     # 不属于任何操作的命令（如界面中直接执行的命令），不回放
+        self.pending = []
+        self.mismatches = []
+        by_id = {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            self.windows = header.get("windows", True)
+            self.config = header.get("config")  # 会话开始时的配置（旧的跟踪文件没有）
+            config = None
+            for line in f:
+                record = json.loads(line)
+                if record["k"] == "config":
+                    config = record["config"]
+                elif record["k"] == "action":
+                    # 配置在操作之前有变化时，回放该操作前先换成新配置
+                    if config is not None:
+                        record["config"] = config
+                        config = None
+                    record["commands"] = []
+                    by_id[record["id"]] = record
+                    self.actions.append(record)
+                elif record["k"] == "cmd":
+                    if record.get("a") in by_id:
+                        by_id[record["a"]]["commands"].append(record)
+                    else:
+                        self.unowned += 1
+                elif record["k"] == "end" and record["id"] in by_id:
+                    by_id[record["id"]].update(d=record["d"], result=record["result"])
+
+    def begin(self, action):
+        """开始回放一个操作"""
+        self.pending = list(action["commands"])
+
+    def run(self, cmd):
+        """返回记录的命令结果，必要时按记录的耗时等待"""
+        import time
+        if not self.pending or self.pending[0]["cmd"] != cmd:
+            expected = self.pending[0]["cmd"] if self.pending else "（无）"
+            self.mismatches.append((cmd, expected))
+            raise TraceMismatchError(f"回放命令不一致: 实际 {cmd!r}，记录 {expected!r}")
+        record = self.pending.pop(0)
+        if self.speed > 0:
+            time.sleep(record["d"] / self.speed)
+        return subprocess.CompletedProcess(cmd, record["rc"], stdout=record["out"], stderr=record["err"])
+
+    def spawn(self, cmd):
+        """回放后台命令的启动"""
+        return self.run(cmd)
+
+def replay_trace(path, speed=1.0):
+    """按顺序回放跟踪文件中的操作，返回每个操作的记录耗时、回放耗时和结果是否一致"""
+    import tempfile
+    import time
+    backend = ReplayBackend(path, speed)
+    report = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 在临时目录中使用记录时的配置运行，回放不会修改本机的配置和指纹文件
+        config_file = os.path.join(work_dir, "virtual_ip_config.json")
+        if backend.config is not None:
+            with open(config_file, 'w', encoding='utf-8') as f:
+                json.dump(backend.config, f, ensure_ascii=False, indent=2)
+        app = VirtualIPSwitcher(headless=True, backend=backend, config_file=config_file)
+        for action in backend.actions:
+            if "config" in action:
+                app.config = action["config"]
+            backend.begin(action)
+            mismatches = len(backend.mismatches)
+            start = time.perf_counter()
+            try:
+                result = getattr(app, action["name"])(**action["args"])
+                # 结果按JSON比较（元组与列表视为相同）
+                same = json.loads(json.dumps(result, ensure_ascii=False)) == action.get("result")
+            except TraceMismatchError:
+                same = False
+            elapsed = time.perf_counter() - start
+            report.append({"name": action["name"], "recorded_ms": round(action.get("d", 0) * 1000, 1),
+                           "replayed_ms": round(elapsed * 1000, 1),
+                           "ok": same and len(backend.mismatches) == mismatches and not backend.pending})
+    return report, backend
 
 class VirtualIPSwitcher:
-    def __init__(self):
+    def __init__(self, headless=False, backend=None, config_file="virtual_ip_config.json"):
         self.setup_logging()  # 初始化日志系统
-        self.config_file = "virtual_ip_config.json"
+        self.backend = backend or CommandBackend()
+        self.headless = headless
+        self.config_file = config_file
         self.config = self.load_config()
-        self.setup_gui()
+        self.mark_config_synced(self.read_config_text())
+        self.config_watcher = ConfigFileWatcher(self.config_file)
+        config_dir = os.path.dirname(os.path.abspath(self.config_file))
+        self.fingerprint_index = NetworkFingerprintIndex(os.path.join(config_dir, "network_fingerprints.json"))
+        self.latency_history = LatencyHistory(os.path.join(config_dir, "latency_history.json"))
+        self.dhcp_leases = {}  # 网卡名称 -> 最近一次获取的DHCP租约
+        self.applying = False  # 界面中是否有配置正在后台应用
+        # 代理模式（无界面）下不创建窗口
+        if not headless:
+            self.setup_gui()
+            self.start_link_monitor()
+            self.root.after(self.config.get("config_watch_interval_ms", 1000), self.watch_config_file)
         
     def setup_logging(self):
         """设置日志系统"""
         try:
             # 创建logs目录
-            if not os.path.exists('logs'):
-                os.makedirs('logs')
+            if not os.path.exists(os.path.dirname(LOG_FILE)):
+                os.makedirs(os.path.dirname(LOG_FILE))
             
-            # 创建日志器
+            # 创建日志器（同一进程中多个实例共用处理器）
             self.logger = logging.getLogger('VirtualIPSwitcher')
             self.logger.setLevel(logging.INFO)
+            if self.logger.handlers:
+                return
             
             # 创建文件处理器（最多保存5个日志文件，每个最大1MB）
             file_handler = RotatingFileHandler(
-                'logs/virtual_ip_switcher.log', 
+                LOG_FILE, 
                 maxBytes=1024*1024, 
-                backupCount=5,
+                backupCount=LOG_BACKUP_COUNT,
                 encoding='utf-8'
             )
             file_handler.setLevel(logging.INFO)
@@ -92,12 +605,106 @@ class VirtualIPSwitcher:
             return default_config
     
     def save_config(self):
-        """保存配置文件"""
+        """保存配置文件，返回是否已写入"""
+        # 文件在上次同步后被其他程序修改过时先处理冲突，避免直接覆盖
+        if self.config_changed_on_disk() and not self.resolve_save_conflict():
+            return False
         # 在保存前创建备份
         self.backup_config()
+        text = json.dumps(self.config, ensure_ascii=False, indent=2)
         with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, ensure_ascii=False, indent=2)
+            f.write(text)
+        self.mark_config_synced(text)
         self.log_info("配置已保存")
+        return True
+
+    def read_config_text(self):
+        """读取配置文件原文，文件不存在或无法读取时返回 None"""
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def mark_config_synced(self, text):
+        """记录与磁盘一致的配置：文件原文和内存配置的快照"""
+        self.synced_text = text
+        self.config_snapshot = json.dumps(self.config, ensure_ascii=False, sort_keys=True)
+
+    def config_is_dirty(self):
+        """内存中的配置是否有尚未保存的修改"""
+        return json.dumps(self.config, ensure_ascii=False, sort_keys=True) != self.config_snapshot
+
+    def config_changed_on_disk(self):
+        """配置文件是否在上次同步后被其他程序修改"""
+        text = self.read_config_text()
+        return text is not None and text != self.synced_text
+
+    def resolve_save_conflict(self):
+        """保存时发现文件已被外部修改，返回是否继续覆盖"""
+        self.log_error("保存配置时发现配置文件已被其他程序修改")
+        if self.headless:
+            # 代理模式下不覆盖外部修改
+            return False
+        if messagebox.askyesno("配置冲突", "配置文件已被其他程序修改。\n\n"
+                               "是：用程序中的配置覆盖文件\n否：放弃本次修改，载入文件中的配置"):
+            self.log_info("用户选择覆盖外部修改的配置文件")
+            return True
+        self.reload_config(force=True)
+        return False
+
+    def watch_config_file(self):
+        """定时检查配置文件是否被外部修改"""
+        try:
+            self.check_config_file()
+        finally:
+            self.root.after(self.config.get("config_watch_interval_ms", 1000), self.watch_config_file)
+
+    def check_config_file(self):
+        """配置文件有变化时重新加载"""
+        if self.config_watcher.poll():
+            self.reload_config()
+
+    def reload_config(self, force=False):
+        """重新加载外部修改过的配置文件，只更新有变化的列表行"""
+        text = self.read_config_text()
+        if text is None or text == self.synced_text:
+            return False
+        try:
+            new_config = json.loads(text)
+            if not isinstance(new_config.get("virtual_ips"), list):
+                raise ValueError("缺少 virtual_ips 列表")
+        except ValueError as e:
+            # 文件可能仍在写入中，等待下一次变化通知
+            self.log_error(f"重新加载配置文件失败: {e}")
+            return False
+
+        if not force and self.config_is_dirty():
+            self.log_error("配置文件已被其他程序修改，而程序中有未保存的修改")
+            if self.headless or not messagebox.askyesno(
+                    "配置冲突", "配置文件已被其他程序修改，而程序中有未保存的修改。\n\n"
+                                "是：载入文件中的配置（放弃未保存的修改）\n否：保留程序中的配置（保存时将覆盖文件）"):
+                # 记住已看到这次外部修改，保存时不再重复提示
+                self.synced_text = text
+                return False
+
+        old_profiles = self.config.get("virtual_ips", [])
+        new_profiles = new_config["virtual_ips"]
+        old_by_name = {c.get("name"): c for c in old_profiles}
+        new_by_name = {c.get("name"): c for c in new_profiles}
+        added = sum(1 for name in new_by_name if name not in old_by_name)
+        removed = sum(1 for name in old_by_name if name not in new_by_name)
+        changed = sum(1 for name, c in new_by_name.items() if name in old_by_name and old_by_name[name] != c)
+
+        if not self.headless:
+            self.update_ip_list_rows(old_profiles, new_profiles)
+        self.config = new_config
+        self.mark_config_synced(text)
+        if not self.headless:
+            self.adapter_var.set(self.config.get("adapter_name", self.adapter_var.get()))
+            self.status_label.config(text=f"配置文件已重新加载：新增 {added}，删除 {removed}，修改 {changed}", foreground="green")
+        self.log_info(f"配置文件已被外部修改并重新加载：新增 {added}，删除 {removed}，修改 {changed}")
+        return True
     
     def backup_config(self):
         """备份配置文件"""
@@ -133,7 +740,7 @@ class VirtualIPSwitcher:
         """设置图形用户界面"""
         self.root = tk.Tk()
         self.root.title("虚拟IP切换器 - v2.1")
-        self.root.geometry("550x500")
+        self.root.geometry("550x700")
         self.root.resizable(False, False)
         
         # 设置窗口图标（如果有的话）
@@ -186,6 +793,8 @@ class VirtualIPSwitcher:
         ttk.Button(button_frame, text="添加IP配置", command=self.add_ip_config).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="编辑IP配置", command=self.edit_ip_config).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="删除IP配置", command=self.delete_ip_config).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="添加范围", command=self.add_range_template).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="添加DHCP", command=self.add_dhcp_profile).pack(side=tk.LEFT, padx=5)
         
         # 高级功能按钮框架
         advanced_frame = ttk.Frame(main_frame)
@@ -195,11 +804,30 @@ class VirtualIPSwitcher:
         ttk.Button(advanced_frame, text="导入配置", command=self.import_config).pack(side=tk.LEFT, padx=5)
         ttk.Button(advanced_frame, text="获取当前IP", command=self.get_current_ip).pack(side=tk.LEFT, padx=5)
         ttk.Button(advanced_frame, text="网络诊断", command=self.network_diagnosis).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="延迟测试", command=self.test_selected_latency).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="查看日志", command=self.show_log_viewer).pack(side=tk.LEFT, padx=5)
         
         # 状态标签
         self.status_label = ttk.Label(main_frame, text="就绪", foreground="green")
         self.status_label.grid(row=5, column=0, columnspan=3, pady=10)
         
+        # 延迟趋势图（选中配置的网关延迟历史）
+        ttk.Label(main_frame, text="延迟趋势:").grid(row=6, column=0, sticky=(tk.W, tk.N), pady=5)
+        self.trend_canvas = tk.Canvas(main_frame, width=380, height=80, background="white", highlightthickness=1)
+        self.trend_canvas.grid(row=6, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=5, padx=(10, 0))
+        self.ip_listbox.bind('<<ListboxSelect>>', lambda event: self.draw_latency_trend())
+        
+        # 后台延迟测量结果由主线程定时取出
+        import queue
+        self.latency_results = queue.Queue()
+        self.root.after(200, self.poll_latency_results)
+        
+        # 实时流量图（选中网卡的收发速率）
+        ttk.Label(main_frame, text="实时流量:").grid(row=7, column=0, sticky=(tk.W, tk.N), pady=5)
+        self.traffic_canvas = tk.Canvas(main_frame, width=380, height=80, background="white", highlightthickness=1)
+        self.traffic_canvas.grid(row=7, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=5, padx=(10, 0))
+        self.start_traffic_sampler()
+        
         # 配置列权重
         main_frame.columnconfigure(1, weight=1)
         list_frame.columnconfigure(0, weight=1)
@@ -215,8 +843,47 @@ class VirtualIPSwitcher:
         """更新IP配置列表显示"""
         self.ip_listbox.delete(0, tk.END)
         for ip_config in self.config["virtual_ips"]:
-            display_text = f"{ip_config['name']} - {ip_config['ip']}"
-            self.ip_listbox.insert(tk.END, display_text)
+            self.ip_listbox.insert(tk.END, self.display_text(ip_config))
+
+    def update_ip_list_rows(self, old_profiles, new_profiles):
+        """比较新旧配置列表，只删除/插入有变化的行"""
+        import difflib
+        old_keys = [json.dumps(c, ensure_ascii=False, sort_keys=True) for c in old_profiles]
+        new_keys = [json.dumps(c, ensure_ascii=False, sort_keys=True) for c in new_profiles]
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        # 从后往前修改，前面的行号保持不变
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            if i2 > i1:
+                self.ip_listbox.delete(i1, i2 - 1)
+            for offset, ip_config in enumerate(new_profiles[j1:j2]):
+                self.ip_listbox.insert(i1 + offset, self.display_text(ip_config))
+
+    def display_text(self, ip_config):
+        """列表中显示的文本；范围模板只显示一行"""
+        if is_template(ip_config):
+            try:
+                count = RangeTemplate(ip_config).count()
+            except ValueError:
+                count = "?"
+            return f"{ip_config['name']} - {ip_config['ip']} ~ {ip_config.get('ip_end', '')} (范围, {count}个)"
+        if is_dhcp(ip_config):
+            return f"{ip_config['name']} - DHCP"
+        return f"{ip_config['name']} - {ip_config['ip']}"
+
+    def find_profile(self, reference, ip=None):
+        """按名称查找配置；范围模板可通过 ip 参数或 "模板名#IP" 指定其中的地址"""
+        name = reference
+        entry = next((c for c in self.config["virtual_ips"] if c["name"] == name), None)
+        if entry is None and '#' in reference:
+            name, ip = reference.rsplit('#', 1)
+            entry = next((c for c in self.config["virtual_ips"] if c["name"] == name), None)
+        if entry is not None and is_template(entry) and ip:
+            template = RangeTemplate(entry)
+            index = template.index_of(ip)
+            return None if index is None else template.member(index)
+        return entry
     
     def apply_ip_config(self):
         """应用选定的IP配置"""
@@ -225,86 +892,511 @@ class VirtualIPSwitcher:
             messagebox.showwarning("警告", "请先选择一个IP配置！")
             return
         
-        ip_config = self.config["virtual_ips"][selection[0]]
-        adapter_name = self.adapter_var.get()
-        
-        # 检查IP是否已被其他适配器使用
-        if self.is_ip_in_use(ip_config["ip"]):
-            if not messagebox.askyesno("IP冲突警告", f"IP地址 {ip_config['ip']} 可能已被其他适配器使用，是否继续应用此配置？"):
-                self.log_info(f"用户取消应用IP配置: {ip_config['name']}")
+        self.switch_to_profile(self.config["virtual_ips"][selection[0]])
+
+    def run_in_background(self, work, done):
+        """在后台线程中执行 work()，完成后在界面线程中调用 done(结果)"""
+        import queue
+        import threading
+        results = queue.Queue(maxsize=1)
+
+        def worker():
+            try:
+                results.put((True, work()))
+            except Exception as e:
+                results.put((False, e))
+
+        def check():
+            try:
+                ok, value = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, check)
                 return
-        
+            if ok:
+                done(value)
+            else:
+                self.log_error(f"后台操作失败: {value}")
+                self.applying = False
+                self.status_label.config(text=f"操作失败: {value}", foreground="red")
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, check)
+
+    def switch_to_profile(self, ip_config):
+        """切换到指定的IP配置（带界面提示）；应用在后台线程中进行，界面不会卡住"""
+        if self.applying:
+            messagebox.showwarning("警告", "正在应用其他IP配置，请稍候")
+            return False
+        # 范围模板先选择其中的一个地址
+        if is_template(ip_config):
+            ip_config = self.select_template_member(ip_config)
+            if ip_config is None:
+                return False
+
+        self.applying = True
+        if is_dhcp(ip_config):
+            # DHCP地址由服务器分配，不需要检查冲突
+            self.start_switch(ip_config)
+            return True
+
+        # 在后台检查IP是否已被其他适配器使用，检查完成后再询问用户并应用
+        self.status_label.config(text=f"正在检查IP冲突: {ip_config['ip']}...", foreground="blue")
+        self.run_in_background(lambda: self.is_ip_in_use(ip_config["ip"]),
+                               lambda in_use: self.confirm_switch(ip_config, in_use))
+        return True
+
+    def confirm_switch(self, ip_config, in_use):
+        """IP冲突检查完成后，必要时让用户确认，然后开始应用"""
+        if in_use and not messagebox.askyesno("IP冲突警告", f"IP地址 {ip_config['ip']} 可能已被其他适配器使用，是否继续应用此配置？"):
+            self.log_info(f"用户取消应用IP配置: {ip_config['name']}")
+            self.applying = False
+            self.status_label.config(text="已取消应用", foreground="orange")
+            return
+        self.start_switch(ip_config)
+
+    def start_switch(self, ip_config):
+        """在后台线程中将配置应用到当前选择的网卡"""
+        adapter_name = self.adapter_var.get()
+        waiting = "正在等待DHCP租约" if is_dhcp(ip_config) else "正在应用IP配置"
+        self.status_label.config(text=f"{waiting}: {ip_config['name']}...", foreground="blue")
+        self.run_in_background(lambda: self.apply_profile(ip_config, adapter_name),
+                               lambda result: self.finish_switch(ip_config, adapter_name, *result))
+
+    def finish_switch(self, ip_config, adapter_name, success, message):
+        """后台应用完成后显示结果"""
+        self.applying = False
+        if success:
+            if is_dhcp(ip_config):
+                # 使用租约中的地址、网关和DNS显示结果并测量延迟
+                ip_config = dict(ip_config, **self.dhcp_leases[adapter_name])
+            self.status_label.config(text=f"IP配置已应用: {ip_config['name']} - {ip_config['ip']}", foreground="green")
+            messagebox.showinfo("成功", f"IP配置已成功应用:\n{ip_config['name']}\n{ip_config['ip']}")
+            self.measure_profile_latency(ip_config)
+        else:
+            self.status_label.config(text="应用失败", foreground="red")
+            messagebox.showerror("错误", message)
+
+    def apply_profile(self, ip_config, adapter_name):
+        """将IP配置应用到指定网卡，返回 (是否成功, 提示信息)"""
+        if is_dhcp(ip_config):
+            return self.apply_dhcp_profile(ip_config, adapter_name)
+        try:
+            parsed = parse_ip_config(ip_config["ip"], ip_config["subnet"],
+                                     ip_config.get("gateway", ""), ip_config.get("dns", ""))
+        except ValueError as e:
+            error_msg = f"IP配置无效:\n{e}"
+            self.log_error(error_msg)
+            return False, error_msg
+
         try:
             # 使用管理员权限执行IP配置命令
-            cmd = f'netsh interface ip set address "{adapter_name}" static {ip_config["ip"]} {ip_config["subnet"]} {ip_config["gateway"]} 1'
+            if not self.backend.windows:
+                # Linux：替换网卡上的全局地址和默认路由
+                family = "-4" if parsed.version == 4 else "-6"
+                cmd = (f'ip {family} addr flush dev "{adapter_name}" scope global && '
+                       f'ip {family} addr add {ip_config["ip"]}/{parsed.prefix} dev "{adapter_name}"')
+                if ip_config.get("gateway"):
+                    cmd += f' && ip {family} route replace default via {ip_config["gateway"]} dev "{adapter_name}"'
+                dns_cmd = f'resolvectl dns "{adapter_name}" {ip_config.get("dns")}'
+            elif parsed.version == 4:
+                cmd = f'netsh interface ip set address "{adapter_name}" static {ip_config["ip"]} {parsed.mask_text} {ip_config["gateway"]} 1'
+                dns_cmd = f'netsh interface ip set dns "{adapter_name}" static {ip_config.get("dns")} primary'
+            else:
+                cmd = f'netsh interface ipv6 set address "{adapter_name}" {ip_config["ip"]}/{parsed.prefix}'
+                if ip_config.get("gateway"):
+                    cmd += f' && netsh interface ipv6 add route ::/0 "{adapter_name}" {ip_config["gateway"]}'
+                dns_cmd = f'netsh interface ipv6 set dnsservers "{adapter_name}" static {ip_config.get("dns")} primary'
             self.log_info(f"正在应用IP配置: {ip_config['name']} - {ip_config['ip']}")
-            
+
             # 在Windows中，通常需要管理员权限才能修改IP配置
-            result = subprocess.run(
-                cmd, 
-                shell=True, 
-                capture_output=True, 
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            if result.returncode == 0:
-                # 设置DNS（如果配置中有DNS信息）
-                if "dns" in ip_config and ip_config["dns"]:
-                    dns_result = subprocess.run(
-                        f'netsh interface ip set dns "{adapter_name}" static {ip_config["dns"]} primary', 
-                        shell=True, 
-                        capture_output=True, 
-                        text=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW
-                    )
-                    if dns_result.returncode != 0:
-                        self.log_error(f"设置DNS时出现警告: {dns_result.stderr}")
-                
-                self.status_label.config(text=f"IP配置已应用: {ip_config['name']} - {ip_config['ip']}", foreground="green")
-                messagebox.showinfo("成功", f"IP配置已成功应用:\n{ip_config['name']}\n{ip_config['ip']}")
-                
-                # 刷新网络连接
-                self.refresh_network_connection()
-                self.log_info(f"IP配置应用成功: {ip_config['name']}")
-            else:
-                self.status_label.config(text="应用失败", foreground="red")
+            result = self.run_command(cmd)
+
+            if result.returncode != 0:
                 error_msg = f"应用IP配置失败:\n{result.stderr}"
                 self.log_error(error_msg)
-                messagebox.showerror("错误", error_msg)
-                
+                return False, error_msg
+
+            # 设置DNS（如果配置中有DNS信息）
+            if "dns" in ip_config and ip_config["dns"]:
+                dns_result = self.run_command(dns_cmd)
+                if dns_result.returncode != 0:
+                    self.log_error(f"设置DNS时出现警告: {dns_result.stderr}")
+
+            self.log_info(f"IP配置应用成功: {ip_config['name']}")
+
+            # 发送免费ARP，让网关和其他主机尽快更新ARP缓存
+            if parsed.version == 4:
+                self.start_announce(adapter_name, ip_config["ip"], ip_config.get("gateway", ""))
+
+            # 记住当前网络与该配置的对应关系（范围模板记录为 "模板名#IP"）
+            reference = f"{ip_config['template']}#{ip_config['ip']}" if "template" in ip_config else ip_config["name"]
+            self.start_fingerprint_learning(reference, adapter_name, ip_config.get("gateway", ""))
+            return True, f"IP配置已应用: {ip_config['name']} - {ip_config['ip']}"
         except Exception as e:
             error_msg = f"应用IP配置时发生错误:\n{str(e)}"
             self.log_error(error_msg)
-            self.status_label.config(text="应用失败", foreground="red")
-            messagebox.showerror("错误", error_msg)
-    
-    def refresh_network_connection(self):
-        """刷新网络连接"""
-        try:
-            # 尝试释放并重新获取IP
-            subprocess.run(
-                'ipconfig /release && ipconfig /renew', 
-                shell=True, 
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            self.log_info("网络连接已刷新")
+            return False, error_msg
+
+    def apply_dhcp_profile(self, ip_config, adapter_name):
+        """将网卡的地址和DNS切换为DHCP，只在该网卡上等待租约，返回 (是否成功, 提示信息)"""
+        import time
+        timeout = self.config.get("dhcp_timeout_ms", 30000) / 1000
+        self.log_info(f"正在应用IP配置: {ip_config['name']} - DHCP ({adapter_name})")
+        start = time.perf_counter()
+        try:
+            if self.backend.windows:
+                result = self.run_command(f'netsh interface ip set address name="{adapter_name}" source=dhcp')
+                if result.returncode != 0:
+                    error_msg = f"切换到DHCP失败:\n{result.stderr or result.stdout}"
+                    self.log_error(error_msg)
+                    return False, error_msg
+                dns_result = self.run_command(f'netsh interface ip set dnsservers name="{adapter_name}" source=dhcp')
+                if dns_result.returncode != 0:
+                    self.log_error(f"设置DNS时出现警告: {dns_result.stderr}")
+                # 不等待 ipconfig /renew 结束（它可能阻塞远超超时时间），整个获取过程以截止时间为界
+                self.spawn_command(f'ipconfig /renew "{adapter_name}"')
+                lease = self.wait_for_lease(adapter_name, start + timeout)
+            elif self.backend.live:
+                # Linux：清除网卡上的全局地址后直接在该网卡上完成DHCP交互
+                self.run_command(f'ip -4 addr flush dev "{adapter_name}" scope global')
+                client = DhcpClient(adapter_name)
+                try:
+                    lease = client.acquire(timeout)
+                finally:
+                    client.close()
+                if lease is not None:
+                    cmd = f'ip -4 addr add {lease["ip"]}/{lease["prefix"]} dev "{adapter_name}"'
+                    if lease["lease_time"] and lease["lease_time"] != 0xFFFFFFFF:
+                        # 地址随租约过期（无限租期除外），避免在不续租时继续使用
+                        cmd += f' valid_lft {lease["lease_time"]} preferred_lft {lease["lease_time"]}'
+                    if lease["gateway"]:
+                        cmd += f' && ip -4 route replace default via {lease["gateway"]} dev "{adapter_name}"'
+                    result = self.run_command(cmd)
+                    if result.returncode != 0:
+                        error_msg = f"应用DHCP租约失败:\n{result.stderr}"
+                        self.log_error(error_msg)
+                        return False, error_msg
+                    if lease["dns"]:
+                        dns_result = self.run_command(f'resolvectl dns "{adapter_name}" {lease["dns"].replace(",", " ")}')
+                        if dns_result.returncode != 0:
+                            self.log_error(f"设置DNS时出现警告: {dns_result.stderr}")
+            else:
+                error_msg = "当前命令后端不支持在Linux上获取DHCP租约"
+                self.log_error(error_msg)
+                return False, error_msg
         except Exception as e:
-            self.log_error(f"刷新网络连接时发生错误: {e}")
-    
+            error_msg = f"切换到DHCP时发生错误:\n{str(e)}"
+            self.log_error(error_msg)
+            return False, error_msg
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if lease is None:
+            error_msg = f"{timeout:.0f} 秒内未从DHCP服务器获取到地址"
+            self.log_error(error_msg)
+            return False, error_msg
+
+        self.dhcp_leases[adapter_name] = lease
+        details = f"IP {lease['ip']}，掩码 {lease['subnet']}，网关 {lease['gateway'] or '无'}，DNS {lease['dns'] or '无'}"
+        if lease.get("server"):
+            details += f"，DHCP服务器 {lease['server']}"
+        if lease.get("lease_time"):
+            details += f"，租期 {lease['lease_time']} 秒"
+        self.log_info(f"DHCP租约已获取，用时 {elapsed_ms:.0f} ms: {details}")
+        self.start_announce(adapter_name, lease["ip"], lease["gateway"])
+        self.start_fingerprint_learning(ip_config["name"], adapter_name, lease["gateway"])
+        return True, f"IP配置已应用: {ip_config['name']} - {lease['ip']} (DHCP，用时 {elapsed_ms:.0f} ms)"
+
+    def wait_for_lease(self, adapter_name, deadline):
+        """轮询网卡地址直到获得DHCP分配的地址（忽略169.254自动配置地址），超时返回 None"""
+        import time
+        interval = self.config.get("dhcp_poll_interval_ms", 200) / 1000
+        while True:
+            info = self.get_adapter_ip_info(adapter_name)
+            if info["ip"] and not info["ip"].startswith("169.254."):
+                return info
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def start_announce(self, adapter_name, ip, gateway=""):
+        """在后台线程中发送免费ARP（模拟和回放的后端不发送）"""
+        if self.backend.live and self.config.get("garp_count", 3) > 0:
+            import threading
+            threading.Thread(target=self.announce_address, daemon=True, args=(adapter_name, ip, gateway)).start()
+
+    def announce_address(self, adapter_name, ip, gateway=""):
+        """连续发送免费ARP通告新地址，并测量地址生效后收到第一个入站包的时间"""
+        import time
+        count = self.config.get("garp_count", 3)
+        interval = self.config.get("garp_interval_ms", 200) / 1000
+        timeout = self.config.get("first_packet_timeout_ms", 5000) / 1000
+        reader = InterfaceCounterReader(adapter_name)
+        baseline = reader.read()
+        start = time.perf_counter()
+        first_packet = None
+        sent = 0
+        try:
+            announcer = GratuitousArpSender(adapter_name, ip, gateway)
+        except OSError as e:
+            self.log_error(f"无法发送免费ARP: {e}")
+            announcer = None
+        try:
+            next_send = start
+            while True:
+                now = time.perf_counter()
+                if announcer is not None and sent < count and now >= next_send:
+                    announcer.send()
+                    sent += 1
+                    next_send += interval
+                if first_packet is None and baseline is not None:
+                    counters = reader.read()
+                    if counters is not None and counters["rx_packets"] > baseline["rx_packets"]:
+                        first_packet = now - start
+                burst_done = announcer is None or sent >= count
+                if burst_done and (first_packet is not None or baseline is None or now - start >= timeout):
+                    break
+                time.sleep(0.005)
+        except OSError as e:
+            self.log_error(f"发送免费ARP时发生错误: {e}")
+        finally:
+            if announcer is not None:
+                announcer.close()
+
+        if first_packet is not None:
+            self.log_info(f"已发送 {sent} 次免费ARP ({ip})，地址生效后 {first_packet * 1000:.1f} ms 收到第一个入站包")
+        elif baseline is None:
+            self.log_info(f"已发送 {sent} 次免费ARP ({ip})，无法读取网卡计数器，未测量入站包时间")
+        else:
+            self.log_info(f"已发送 {sent} 次免费ARP ({ip})，{timeout * 1000:.0f} ms 内未收到入站包")
+        return sent, first_packet
+
+    def run_command(self, cmd):
+        """通过命令后端执行系统命令并返回结果"""
+        return self.backend.run(cmd)
+
+    def spawn_command(self, cmd):
+        """通过命令后端启动系统命令，不等待其结束"""
+        return self.backend.spawn(cmd)
+
+    def get_adapter_ip_info(self, adapter_name):
+        """获取网卡当前的IP、子网掩码和网关"""
+        info = {"ip": "", "subnet": "", "gateway": "", "dns": ""}
+        try:
+            if self.backend.windows:
+                result = self.run_command(f'netsh interface ip show config name="{adapter_name}"')
+                for line in result.stdout.split('\n'):
+                    if ':' not in line:
+                        continue
+                    key, value = [part.strip() for part in line.split(':', 1)]
+                    if key in ("IP Address", "IP 地址") and not info["ip"]:
+                        info["ip"] = value
+                    elif key in ("Subnet Prefix", "子网前缀") and "(" in value:
+                        # 形如 192.168.1.0/24 (mask 255.255.255.0)
+                        info["subnet"] = value.split()[-1].rstrip(')')
+                    elif key in ("Default Gateway", "默认网关") and value and not info["gateway"]:
+                        info["gateway"] = value.split()[0]
+                    elif "DNS" in key and value and not info["dns"] and parse_ip_address(value.split()[0]):
+                        info["dns"] = value.split()[0]
+            else:
+                result = self.run_command(f'ip -4 -o addr show dev "{adapter_name}"')
+                for part in result.stdout.split():
+                    if '/' in part and part[0].isdigit():
+                        info["ip"], info["subnet"] = part.split('/')
+                        break
+                result = self.run_command(f'ip -4 route show default dev "{adapter_name}"')
+                parts = result.stdout.split()
+                if "via" in parts:
+                    info["gateway"] = parts[parts.index("via") + 1]
+        except Exception as e:
+            self.log_error(f"获取网卡IP信息时发生错误: {e}")
+        return info
+
+    def get_gateway_mac(self, gateway, adapter_name):
+        """从ARP缓存中获取网关的MAC地址"""
+        if not gateway:
+            return ""
+        try:
+            if self.backend.windows:
+                result = self.run_command(f'arp -a {gateway}')
+                for line in result.stdout.split('\n'):
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0] == gateway:
+                        return parts[1].replace('-', ':').lower()
+            else:
+                result = self.run_command(f'ip neigh show {gateway} dev "{adapter_name}"')
+                parts = result.stdout.split()
+                if "lladdr" in parts:
+                    return parts[parts.index("lladdr") + 1].lower()
+        except Exception as e:
+            self.log_error(f"获取网关MAC地址时发生错误: {e}")
+        return ""
+
+    def get_wifi_ssid(self, adapter_name):
+        """获取无线网卡当前连接的SSID（有线网卡返回空字符串）"""
+        try:
+            if self.backend.windows:
+                result = self.run_command('netsh wlan show interfaces')
+                current_name = None
+                for line in result.stdout.split('\n'):
+                    if ':' not in line:
+                        continue
+                    key, value = [part.strip() for part in line.split(':', 1)]
+                    if key in ("Name", "名称"):
+                        current_name = value
+                    elif key == "SSID" and current_name == adapter_name:
+                        return value
+            else:
+                result = self.run_command(f'iwgetid "{adapter_name}" -r')
+                if result.returncode == 0:
+                    return result.stdout.strip()
+        except Exception as e:
+            self.log_error(f"获取无线网络SSID时发生错误: {e}")
+        return ""
+
+    def get_network_fingerprint(self, adapter_name):
+        """采集当前网络的指纹（网关MAC和IP、子网、SSID）"""
+        info = self.get_adapter_ip_info(adapter_name)
+        subnet = ""
+        try:
+            subnet = parse_ip_config(info["ip"], info["subnet"]).network_text
+        except ValueError:
+            pass
+        return {
+            "gateway_mac": self.get_gateway_mac(info["gateway"], adapter_name),
+            "gateway_ip": info["gateway"],
+            "subnet": subnet,
+            "ssid": self.get_wifi_ssid(adapter_name)
+        }
+
+    def start_fingerprint_learning(self, profile_name, adapter_name, gateway=""):
+        """在后台线程中记录网络指纹（模拟和回放的后端不记录）"""
+        if self.backend.live:
+            import threading
+            threading.Thread(target=self.learn_network_fingerprint, daemon=True,
+                             args=(profile_name, adapter_name, gateway)).start()
+
+    def learn_network_fingerprint(self, profile_name, adapter_name, gateway=""):
+        """等到网关MAC或SSID可以观察到后，记录当前网络指纹与配置名称的对应关系
+
+        刚应用配置时ARP缓存中通常还没有网关，而子网只是刚写入的静态配置，
+        不能代表所在的网络，因此没有网关MAC和SSID时不记录。
+        """
+        import time
+        deadline = time.monotonic() + self.config.get("fingerprint_learn_timeout_ms", 15000) / 1000
+        try:
+            while True:
+                fingerprint = self.get_network_fingerprint(adapter_name)
+                if fingerprint["gateway_mac"] or fingerprint["ssid"]:
+                    break
+                if time.monotonic() >= deadline:
+                    self.log_info(f"未获取到网关MAC或SSID，不记录网络指纹: {profile_name}")
+                    return
+                if gateway:
+                    # ping 一次网关，让系统解析出网关的MAC地址
+                    self.probe_latency(gateway, samples=1)
+                time.sleep(0.5)
+            if self.fingerprint_index.learn(fingerprint, profile_name):
+                self.fingerprint_index.save()
+                self.log_info(f"已记录网络指纹: {NetworkFingerprintIndex.make_key(fingerprint)} -> {profile_name}")
+        except Exception as e:
+            self.log_error(f"记录网络指纹时发生错误: {e}")
+
+    def is_adapter_connected(self, adapter_name):
+        """检查网卡是否处于已连接状态"""
+        try:
+            if os.name == 'nt':
+                result = self.run_command(f'netsh interface show interface name="{adapter_name}"')
+                for line in result.stdout.split('\n'):
+                    if ':' in line:
+                        key, value = [part.strip() for part in line.split(':', 1)]
+                        if key in ("Connect state", "连接状态"):
+                            return value in ("Connected", "已连接")
+                return False
+            with open(f'/sys/class/net/{adapter_name}/operstate', 'r') as f:
+                return f.read().strip() in ("up", "unknown")
+        except Exception:
+            return False
+
+    def start_link_monitor(self):
+        """定时检查网卡连接状态，检测到网络接入时自动识别网络"""
+        self.link_connected = self.is_adapter_connected(self.adapter_var.get())
+        self.root.after(self.config.get("link_check_interval_ms", 5000), self.check_link_state)
+
+    def check_link_state(self):
+        """检查网卡连接状态的变化"""
+        try:
+            connected = self.is_adapter_connected(self.adapter_var.get())
+            if connected and not self.link_connected:
+                self.on_link_up()
+            self.link_connected = connected
+        finally:
+            self.root.after(self.config.get("link_check_interval_ms", 5000), self.check_link_state)
+
+    def on_link_up(self):
+        """网络接入时在后台识别网络，识别完成后推荐（或应用）已知的配置"""
+        adapter_name = self.adapter_var.get()
+        self.run_in_background(lambda: self.identify_network(adapter_name),
+                               lambda result: self.finish_link_up(adapter_name, *result))
+
+    def identify_network(self, adapter_name):
+        """采集当前网络的指纹并查找已知的配置，返回 (指纹, 配置名称)（会等待网络应答，不要在界面线程中调用）
+
+        网卡刚接入时通常还是上一个网络的配置，ARP缓存中也没有网关，
+        因此先 ping 一次当前网关；仍未识别时再向已学习的各个网关发出ARP请求，
+        应答的MAC与记录一致就说明接入的是该网关所在的网络。
+        """
+        fingerprint = {}
+        try:
+            gateway = self.get_adapter_ip_info(adapter_name)["gateway"]
+            if gateway:
+                self.probe_latency(gateway, samples=1, timeout_ms=500)
+            fingerprint = self.get_network_fingerprint(adapter_name)
+            profile_name = self.fingerprint_index.lookup(fingerprint)
+            if profile_name is None and self.backend.live:
+                # 不同网络的网关可能使用相同的IP，按MAC核对
+                known = self.fingerprint_index.gateway_ips
+                if known:
+                    resolver = ArpResolver(adapter_name)
+                    try:
+                        resolved = resolver.resolve(sorted(set(known.values())),
+                                                    self.config.get("gateway_probe_timeout_ms", 1000) / 1000)
+                    finally:
+                        resolver.close()
+                    for ip, mac in resolved.items():
+                        if known.get(mac) == ip:
+                            fingerprint.update(gateway_mac=mac, gateway_ip=ip)
+                            profile_name = self.fingerprint_index.lookup(fingerprint)
+                            break
+            return fingerprint, profile_name
+        except Exception as e:
+            self.log_error(f"识别网络时发生错误: {e}")
+            return fingerprint, None
+
+    def finish_link_up(self, adapter_name, fingerprint, profile_name):
+        """网络识别完成后，按识别结果推荐或应用配置"""
+        self.log_info(f"网卡 {adapter_name} 已连接，网络指纹: {NetworkFingerprintIndex.make_key(fingerprint)}")
+        if not profile_name:
+            return
+
+        ip_config = self.find_profile(profile_name)
+        if ip_config is None:
+            return
+
+        self.log_info(f"识别到已知网络，对应配置: {profile_name}")
+        if self.config.get("auto_apply_known_network", False):
+            self.switch_to_profile(ip_config)
+        elif messagebox.askyesno("识别到已知网络", f"当前网络与配置 '{profile_name}' 匹配，是否应用此配置？"):
+            self.switch_to_profile(ip_config)
+        else:
+            self.status_label.config(text=f"已知网络: {profile_name}", foreground="green")
+
     def is_ip_in_use(self, ip):
-        """检查IP是否已被其他适配器使用"""
-        try:
-            # 使用ping命令检查IP是否可达
-            result = subprocess.run(
-                f'ping -n 1 -w 1000 {ip}', 
-                shell=True, 
-                capture_output=True, 
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            # 如果ping成功，说明IP可能正在使用中
-            is_in_use = result.returncode == 0
+        """检查IP是否已被其他适配器使用（会等待ping应答，不要在界面线程中调用）"""
+        try:
+            # 使用ping命令检查IP是否可达；发送多次，单个丢包不会漏掉正在使用的地址
+            stats = self.probe_latency(ip, samples=self.config.get("conflict_check_samples", 3), timeout_ms=500)
+            # 如果ping有应答，说明IP可能正在使用中
+            is_in_use = stats["received"] > 0
             if is_in_use:
                 self.log_info(f"检测到IP {ip} 可能正在被使用")
             return is_in_use
@@ -312,6 +1404,170 @@ class VirtualIPSwitcher:
             # 出现异常时，默认不提示冲突
             return False
     
+    def probe_latency(self, target, samples=None, timeout_ms=1000):
+        """向目标发送多次ping，返回 min/p50/p95/max 往返时间和丢包率"""
+        samples = samples or self.config.get("latency_samples", 5)
+        if self.backend.windows:
+            cmd = f'ping -n {samples} -w {timeout_ms} {target}'
+        else:
+            cmd = f'ping -c {samples} -W {max(1, timeout_ms // 1000)} -i 0.2 {target}'
+        result = self.run_command(cmd)
+        rtts = [float(value) for value in PING_RTT_PATTERN.findall(result.stdout)]
+        return summarize_rtts(rtts[:samples], samples)
+
+    def latency_targets(self, ip_config):
+        """返回 (历史记录使用的配置名称, 网关, 要测量的目标列表)
+
+        范围模板中的地址共用模板的网关，按模板名称记录；DHCP配置使用当前网卡最近一次租约中的网关和DNS。
+        """
+        name = ip_config.get("template", ip_config["name"])
+        if is_dhcp(ip_config):
+            ip_config = self.dhcp_leases.get(self.adapter_var.get(), {})
+        gateway = ip_config.get("gateway", "")
+        dns_servers = re.split(r'[,\s]+', ip_config.get("dns", "").strip())
+        targets = [target for target in dict.fromkeys([gateway] + dns_servers) if target]
+        return name, gateway, targets
+
+    def measure_profile_latency(self, ip_config):
+        """在后台线程中测量配置的网关和DNS延迟，结果由 poll_latency_results 记录"""
+        import threading
+        name, _, targets = self.latency_targets(ip_config)
+        if not targets:
+            message = "DHCP配置尚未获取租约，" if is_dhcp(ip_config) else ""
+            self.status_label.config(text=f"{ip_config['name']}: {message}没有可测量的网关或DNS", foreground="orange")
+            return
+
+        def worker():
+            for target in targets:
+                self.latency_results.put((name, target, self.probe_latency(target)))
+
+        self.status_label.config(text=f"正在测量延迟: {ip_config['name']}", foreground="blue")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def poll_latency_results(self):
+        """取出后台测量结果，记录历史并刷新趋势图"""
+        import queue
+        updated = False
+        try:
+            while True:
+                name, target, stats = self.latency_results.get_nowait()
+                self.latency_history.record(name, target, stats)
+                self.log_info(f"延迟测量 {name} -> {target}: {format_latency(stats)}")
+                self.status_label.config(text=f"{name} -> {target}: {format_latency(stats)}",
+                                         foreground="green" if stats["received"] else "red")
+                updated = True
+        except queue.Empty:
+            pass
+        if updated:
+            self.latency_history.save()
+            self.draw_latency_trend()
+        self.root.after(200, self.poll_latency_results)
+
+    def test_selected_latency(self):
+        """测量选中配置的延迟"""
+        selection = self.ip_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("警告", "请先选择一个IP配置！")
+            return
+        self.measure_profile_latency(self.config["virtual_ips"][selection[0]])
+
+    def draw_latency_trend(self):
+        """绘制选中配置网关的延迟趋势：蓝线为p50，橙线为p95，红点表示有丢包"""
+        canvas = self.trend_canvas
+        canvas.delete("all")
+        selection = self.ip_listbox.curselection()
+        if not selection:
+            return
+        name, gateway, _ = self.latency_targets(self.config["virtual_ips"][selection[0]])
+        samples = self.latency_history.samples(name, gateway)
+        width, height = int(canvas["width"]), int(canvas["height"])
+        if not samples:
+            canvas.create_text(width // 2, height // 2, text="暂无延迟数据（点击\"延迟测试\"）", fill="gray")
+            return
+
+        top = max([s[2] for s in samples if s[2] is not None] or [1.0])
+        step = (width - 10) / max(1, self.latency_history.size - 1)
+
+        def y_of(value):
+            return height - 5 - (height - 20) * value / top
+
+        for column, color in ((1, "blue"), (2, "orange")):
+            points = []
+            for i, sample in enumerate(samples):
+                if sample[column] is not None:
+                    points.extend([5 + i * step, y_of(sample[column])])
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color)
+            elif points:
+                canvas.create_oval(points[0] - 2, points[1] - 2, points[0] + 2, points[1] + 2, outline=color)
+        for i, sample in enumerate(samples):
+            if sample[3] > 0:
+                canvas.create_oval(3 + i * step, 3, 7 + i * step, 7, fill="red", outline="red")
+
+        latest = samples[-1]
+        label = f"p50 {latest[1]:g} ms / p95 {latest[2]:g} ms" if latest[1] is not None else "最近一次无应答"
+        canvas.create_text(width - 5, 5, text=f"{label}，丢包 {latest[3]:.0%}", anchor="ne", font=("Arial", 8))
+
+    def start_traffic_sampler(self):
+        """按配置的频率采样网卡计数器，并按较低的频率批量刷新流量图"""
+        import time
+        self.sampler_interval = self.config.get("sampler_interval_ms", 500)
+        self.traffic_redraw_interval = self.config.get("traffic_redraw_ms", 1000)
+        self.traffic_sampler = ThroughputSampler()
+        self.counter_reader = InterfaceCounterReader(self.adapter_var.get())
+        self.traffic_last_redraw = 0.0
+        # 图形元素只创建一次，之后仅更新坐标和文字
+        canvas = self.traffic_canvas
+        self.traffic_rx_line = canvas.create_line(0, 0, 0, 0, fill="green")
+        self.traffic_tx_line = canvas.create_line(0, 0, 0, 0, fill="blue")
+        self.traffic_text = canvas.create_text(int(canvas["width"]) - 5, 5, anchor="ne", font=("Arial", 8),
+                                               text="正在采样...")
+        self.traffic_last_redraw = time.monotonic()
+        self.root.after(self.sampler_interval, self.sample_traffic)
+
+    def sample_traffic(self):
+        """读取一次网卡计数器"""
+        import time
+        try:
+            adapter_name = self.adapter_var.get()
+            if adapter_name != self.counter_reader.adapter_name:
+                self.counter_reader = InterfaceCounterReader(adapter_name)
+                self.traffic_sampler.clear()
+            counters = self.counter_reader.read()
+            now = time.monotonic()
+            if counters is not None:
+                self.traffic_sampler.add(now, counters)
+            if now - self.traffic_last_redraw >= self.traffic_redraw_interval / 1000:
+                self.traffic_last_redraw = now
+                self.draw_traffic(counters is not None)
+        finally:
+            self.root.after(self.sampler_interval, self.sample_traffic)
+
+    def draw_traffic(self, available=True):
+        """刷新流量图：绿线为接收速率，蓝线为发送速率"""
+        canvas = self.traffic_canvas
+        if not available:
+            canvas.coords(self.traffic_rx_line, 0, 0, 0, 0)
+            canvas.coords(self.traffic_tx_line, 0, 0, 0, 0)
+            canvas.itemconfig(self.traffic_text, text="无法读取网卡计数器")
+            return
+        rates = self.traffic_sampler.rates()
+        if not rates:
+            return
+        width, height = int(canvas["width"]), int(canvas["height"])
+        top = max(max(rate[0], rate[1]) for rate in rates) or 1.0
+        step = (width - 10) / max(1, self.traffic_sampler.samples.maxlen - 2)
+        for line, column in ((self.traffic_rx_line, 0), (self.traffic_tx_line, 1)):
+            points = []
+            for i, rate in enumerate(rates):
+                points.extend([5 + i * step, height - 5 - (height - 20) * rate[column] / top])
+            if len(points) == 2:
+                points.extend(points)
+            canvas.coords(line, *points)
+        rx, tx, packets, errors = rates[-1]
+        canvas.itemconfig(self.traffic_text, text=f"接收 {format_rate(rx)}  发送 {format_rate(tx)}  "
+                                                  f"{packets:.0f} 包/秒  错误 {errors:.0f}/秒")
+
     def add_ip_config(self):
         """添加新的IP配置"""
         self.log_info("启动添加IP配置对话框")
@@ -324,19 +1580,120 @@ class VirtualIPSwitcher:
             messagebox.showwarning("警告", "请先选择一个IP配置！")
             return
         
+        ip_config = self.config["virtual_ips"][selection[0]]
+        if is_template(ip_config):
+            self.log_info("启动编辑范围模板对话框")
+            RangeTemplateDialog(self.root, self, "编辑范围模板", ip_config, selection[0])
+            return
+        if is_dhcp(ip_config):
+            self.add_dhcp_profile(ip_config, selection[0])
+            return
         self.log_info("启动编辑IP配置对话框")
-        AddEditIPConfigDialog(self.root, self, "编辑IP配置", self.config["virtual_ips"][selection[0]], selection[0])
-    
-    def delete_ip_config(self):
-        """删除选中的IP配置"""
-        selection = self.ip_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("警告", "请先选择一个IP配置！")
+        AddEditIPConfigDialog(self.root, self, "编辑IP配置", ip_config, selection[0])
+
+    def add_range_template(self):
+        """添加范围模板"""
+        self.log_info("启动添加范围模板对话框")
+        RangeTemplateDialog(self.root, self, "添加范围模板")
+
+    def add_dhcp_profile(self, ip_config=None, index=None):
+        """添加或重命名DHCP配置（DHCP配置只需要名称）"""
+        from tkinter import simpledialog
+        name = simpledialog.askstring("DHCP配置", "配置名称:", parent=self.root,
+                                      initialvalue=ip_config["name"] if ip_config else "DHCP")
+        if name is None:
             return
-        
-        if messagebox.askyesno("确认", "确定要删除选定的IP配置吗？"):
-            del self.config["virtual_ips"][selection[0]]
-            self.save_config()
+        name = name.strip()
+        if not name:
+            messagebox.showerror("错误", "配置名称不能为空！")
+            return
+        for i, config in enumerate(self.config["virtual_ips"]):
+            if config["name"] == name and i != index:
+                messagebox.showwarning("警告", f"配置名称 '{name}' 已存在！\n请使用不同的名称")
+                return
+        self.update_ip_config_list({"name": name, "type": "dhcp"}, index)
+
+    def select_template_member(self, template_entry):
+        """分页显示范围模板中的地址（只计算当前页），返回选中的配置"""
+        template = RangeTemplate(template_entry)
+        page_size = 100
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"选择地址 - {template_entry['name']}")
+        dialog.geometry("360x360")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        # 居中显示
+        dialog.geometry("+%d+%d" % (self.root.winfo_rootx() + 50, self.root.winfo_rooty() + 50))
+        
+        ttk.Label(dialog, text=f"范围内共 {template.count()} 个地址，请选择要应用的地址:").pack(pady=5)
+        
+        listbox = tk.Listbox(dialog, height=12)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        state = {"offset": 0, "value": None}
+        page_label = ttk.Label(dialog)
+        
+        def show_page(offset):
+            offset = max(0, min(offset, (template.count() - 1) // page_size * page_size))
+            state["offset"] = offset
+            listbox.delete(0, tk.END)
+            for index in range(offset, min(offset + page_size, template.count())):
+                member = template.member(index)
+                listbox.insert(tk.END, f"{member['name']} - {member['ip']}")
+            page_label.config(text=f"第 {offset // page_size + 1} / {(template.count() - 1) // page_size + 1} 页")
+        
+        nav_frame = ttk.Frame(dialog)
+        nav_frame.pack(pady=5)
+        ttk.Button(nav_frame, text="上一页", command=lambda: show_page(state["offset"] - page_size)).pack(side=tk.LEFT, padx=5)
+        page_label.pack(in_=nav_frame, side=tk.LEFT, padx=5)
+        ttk.Button(nav_frame, text="下一页", command=lambda: show_page(state["offset"] + page_size)).pack(side=tk.LEFT, padx=5)
+        
+        # 直接输入地址跳转
+        jump_frame = ttk.Frame(dialog)
+        jump_frame.pack(pady=5)
+        jump_var = tk.StringVar()
+        ttk.Entry(jump_frame, textvariable=jump_var, width=20).pack(side=tk.LEFT, padx=5)
+        
+        def jump():
+            index = template.index_of(jump_var.get().strip())
+            if index is None:
+                messagebox.showwarning("警告", "地址不在范围内！", parent=dialog)
+                return
+            show_page(index // page_size * page_size)
+            listbox.selection_clear(0, tk.END)
+            listbox.selection_set(index % page_size)
+            listbox.see(index % page_size)
+        
+        ttk.Button(jump_frame, text="跳转到地址", command=jump).pack(side=tk.LEFT, padx=5)
+        
+        def select():
+            selection = listbox.curselection()
+            if selection:
+                state["value"] = template.member(state["offset"] + selection[0])
+                dialog.destroy()
+            else:
+                messagebox.showwarning("警告", "请选择一个地址", parent=dialog)
+        
+        ttk.Button(dialog, text="选择", command=select).pack(pady=10)
+        show_page(0)
+        
+        # 等待对话框关闭
+        dialog.wait_window()
+        return state["value"]
+    
+    def delete_ip_config(self):
+        """删除选中的IP配置"""
+        selection = self.ip_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("警告", "请先选择一个IP配置！")
+            return
+        
+        if messagebox.askyesno("确认", "确定要删除选定的IP配置吗？"):
+            del self.config["virtual_ips"][selection[0]]
+            if not self.save_config():
+                self.report_not_saved("删除IP配置")
+                return
             self.update_ip_list()
             self.status_label.config(text="IP配置已删除", foreground="green")
             self.log_info("IP配置已删除")
@@ -350,21 +1707,26 @@ class VirtualIPSwitcher:
             # 添加新配置
             self.config["virtual_ips"].append(ip_config)
         
-        self.save_config()
+        if not self.save_config():
+            self.report_not_saved(f"IP配置 {ip_config['name']}")
+            return
         self.update_ip_list()
         self.status_label.config(text="IP配置已更新", foreground="green")
         self.log_info(f"IP配置已{'更新' if index is not None else '添加'}: {ip_config['name']}")
     
+    def report_not_saved(self, change):
+        """保存时选择了放弃本次修改（已载入文件中的配置），提示修改没有保存"""
+        message = f"{change}未保存：已载入配置文件中的内容"
+        self.update_ip_list()
+        self.adapter_var.set(self.config.get("adapter_name", "以太网"))
+        self.status_label.config(text=message, foreground="orange")
+        self.log_info(message)
+        messagebox.showwarning("未保存", message)
+
     def refresh_adapters(self):
         """刷新网卡列表"""
         try:
-            result = subprocess.run(
-                'netsh interface show interface', 
-                shell=True, 
-                capture_output=True, 
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
+            result = self.run_command('netsh interface show interface')
             if result.returncode == 0:
                 # 提取活动的网卡名称
                 lines = result.stdout.split('\n')
@@ -382,7 +1744,9 @@ class VirtualIPSwitcher:
                     if adapter:
                         self.adapter_var.set(adapter)
                         self.config["adapter_name"] = adapter
-                        self.save_config()
+                        if not self.save_config():
+                            self.report_not_saved("网卡选择")
+                            return
                         self.status_label.config(text=f"已选择网卡: {adapter}", foreground="green")
                         self.log_info(f"已选择网卡: {adapter}")
                 else:
@@ -437,13 +1801,17 @@ class VirtualIPSwitcher:
         from tkinter import filedialog
         file_path = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl"), ("All files", "*.*")],
             title="导出配置"
         )
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.config, f, ensure_ascii=False, indent=2)
+                if is_profile_stream_file(file_path):
+                    # CSV/JSON Lines 逐行写出
+                    write_profile_rows(file_path, self.config["virtual_ips"])
+                else:
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        json.dump(self.config, f, ensure_ascii=False, indent=2)
                 self.status_label.config(text="配置已导出", foreground="green")
                 messagebox.showinfo("成功", f"配置已成功导出到:\n{file_path}")
                 self.log_info(f"配置已导出到: {file_path}")
@@ -457,10 +1825,12 @@ class VirtualIPSwitcher:
         """从文件导入配置"""
         from tkinter import filedialog
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl"), ("All files", "*.*")],
             title="导入配置"
         )
-        if file_path:
+        if file_path and is_profile_stream_file(file_path):
+            self.import_profile_rows(file_path)
+        elif file_path:
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     imported_config = json.load(f)
@@ -468,7 +1838,9 @@ class VirtualIPSwitcher:
                 # 验证导入的配置格式
                 if "virtual_ips" in imported_config and "adapter_name" in imported_config:
                     self.config = imported_config
-                    self.save_config()
+                    if not self.save_config():
+                        self.report_not_saved("导入的配置")
+                        return
                     self.update_ip_list()
                     self.status_label.config(text="配置已导入", foreground="green")
                     messagebox.showinfo("成功", f"配置已成功导入自:\n{file_path}")
@@ -483,6 +1855,41 @@ class VirtualIPSwitcher:
                 self.status_label.config(text="导入失败", foreground="red")
                 messagebox.showerror("错误", error_msg)
     
+    def import_profile_rows(self, file_path):
+        """分块导入CSV/JSON Lines配置，按名称合并到现有配置列表"""
+        # 合并到副本中，导入中途失败时现有配置保持不变
+        importer = ProfileStreamImporter(list(self.config["virtual_ips"]))
+        try:
+            for rows in importer.import_file(file_path):
+                self.status_label.config(text=f"正在导入: 已处理 {rows} 行，错误 {importer.error_count} 行", foreground="blue")
+                self.root.update_idletasks()
+        except Exception as e:
+            error_msg = f"导入配置时发生错误:\n{str(e)}"
+            self.log_error(error_msg)
+            self.status_label.config(text="导入失败", foreground="red")
+            messagebox.showerror("错误", error_msg)
+            return
+
+        if importer.added or importer.updated:
+            self.config["virtual_ips"] = importer.profiles
+            if not self.save_config():
+                self.report_not_saved("导入的配置")
+                return
+            self.update_ip_list()
+        for error in importer.errors:
+            self.log_error(f"导入 {file_path} 时跳过无效行 - {error}")
+
+        summary = f"共处理 {importer.rows} 行：新增 {importer.added} 个，更新 {importer.updated} 个，错误 {importer.error_count} 行"
+        self.status_label.config(text=summary, foreground="green" if not importer.error_count else "orange")
+        self.log_info(f"配置已从 {file_path} 导入，{summary}")
+        if importer.error_count:
+            details = "\n".join(importer.errors[:10])
+            if importer.error_count > 10:
+                details += f"\n... 另有 {importer.error_count - 10} 行错误（详见日志）"
+            messagebox.showwarning("导入完成", f"{summary}\n\n{details}")
+        else:
+            messagebox.showinfo("成功", f"{summary}\n来源: {file_path}")
+
     def network_diagnosis(self):
         """执行网络诊断"""
         try:
@@ -511,29 +1918,44 @@ class VirtualIPSwitcher:
             text_widget.insert(tk.END, "正在执行网络诊断...\n\n")
             text_widget.update()
             
-            # 执行各种网络检查
-            import platform
+            # 诊断步骤需要等待网络响应，在后台线程中执行，结果通过队列显示到对话框中
+            import queue
+            import threading
+            output = queue.Queue()
+            threading.Thread(target=self.run_diagnosis_steps, args=(output,), daemon=True).start()
+            self.show_diagnosis_output(dialog, text_widget, output)
             
+        except Exception as e:
+            error_msg = f"执行网络诊断时发生错误:\n{str(e)}"
+            self.log_error(error_msg)
+            messagebox.showerror("错误", error_msg)
+    
+    def show_log_viewer(self):
+        """打开日志查看器"""
+        self.log_info("打开日志查看器")
+        LogViewerDialog(self.root, self)
+
+    def run_diagnosis_steps(self, output):
+        """在后台线程中执行耗时的诊断步骤，输出的文本放入队列，结束时放入 None"""
+        try:
             # 1. 基本网络信息
-            text_widget.insert(tk.END, "=== 基本网络信息 ===\n")
+            output.put("=== 基本网络信息 ===\n")
             import socket
             hostname = socket.gethostname()
-            text_widget.insert(tk.END, f"主机名: {hostname}\n")
+            output.put(f"主机名: {hostname}\n")
             
             try:
                 local_ip = socket.gethostbyname(hostname)
-                text_widget.insert(tk.END, f"本地IP: {local_ip}\n")
+                output.put(f"本地IP: {local_ip}\n")
             except:
-                text_widget.insert(tk.END, "本地IP: 无法获取\n")
+                output.put("本地IP: 无法获取\n")
             
             # 2. 网络连通性测试
-            text_widget.insert(tk.END, "\n=== 网络连通性测试 ===\n")
+            output.put("\n=== 网络连通性测试 ===\n")
             
             # 测试到网关的连通性
-            gateway = self.config.get("adapter_name", "以太网")
-            # 尝试获取当前网关
             try:
-                result = subprocess.run('ipconfig', shell=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
+                result = self.run_command('ipconfig')
                 lines = result.stdout.split('\n')
                 current_gateway = None
                 for line in lines:
@@ -542,70 +1964,76 @@ class VirtualIPSwitcher:
                         break
                 
                 if current_gateway:
-                    text_widget.insert(tk.END, f"默认网关: {current_gateway}\n")
-                    # ping网关
-                    ping_result = subprocess.run(f'ping -n 1 -w 1000 {current_gateway}', 
-                                                shell=True, capture_output=True, text=True, 
-                                                creationflags=subprocess.CREATE_NO_WINDOW)
-                    if ping_result.returncode == 0:
-                        text_widget.insert(tk.END, "网关连通性: 正常\n")
+                    output.put(f"默认网关: {current_gateway}\n")
+                    stats = self.probe_latency(current_gateway)
+                    if stats["received"]:
+                        output.put(f"网关连通性: 正常 ({format_latency(stats)})\n")
                     else:
-                        text_widget.insert(tk.END, "网关连通性: 异常\n")
+                        output.put("网关连通性: 异常\n")
                 else:
-                    text_widget.insert(tk.END, "默认网关: 未找到\n")
+                    output.put("默认网关: 未找到\n")
             except:
-                text_widget.insert(tk.END, "默认网关: 无法获取\n")
+                output.put("默认网关: 无法获取\n")
             
-            # 3. DNS解析测试
-            text_widget.insert(tk.END, "\n=== DNS解析测试 ===\n")
-            try:
-                import urllib.request
-                with urllib.request.urlopen('https://www.baidu.com', timeout=5) as response:
-                    text_widget.insert(tk.END, "DNS解析: 正常 (www.baidu.com)\n")
-            except:
-                text_widget.insert(tk.END, "DNS解析: 异常\n")
+            # 3. 分阶段连通性测试（DNS解析、TCP连接、TLS握手、首字节）
+            output.put("\n=== 分阶段连通性测试 ===\n")
+            probe = ConnectivityProbe(self.config.get("probe_timeouts"))
+            for probe_result in probe.run(self.config.get("probe_targets", DEFAULT_PROBE_TARGETS)):
+                output.put(ConnectivityProbe.format_result(probe_result) + "\n")
+                self.log_info(f"连通性探测 {ConnectivityProbe.format_result(probe_result)}")
             
             # 4. 外网连通性测试
-            text_widget.insert(tk.END, "\n=== 外网连通性测试 ===\n")
+            output.put("\n=== 外网连通性测试 ===\n")
             external_sites = ["www.baidu.com", "www.google.com", "www.github.com"]
             for site in external_sites:
                 try:
-                    result = subprocess.run(f'ping -n 1 -w 1000 {site}', 
-                                           shell=True, capture_output=True, text=True, 
-                                           creationflags=subprocess.CREATE_NO_WINDOW)
-                    if result.returncode == 0:
-                        text_widget.insert(tk.END, f"{site}: 连通正常\n")
+                    stats = self.probe_latency(site)
+                    if stats["received"]:
+                        output.put(f"{site}: 连通正常 ({format_latency(stats)})\n")
                     else:
-                        text_widget.insert(tk.END, f"{site}: 连通异常\n")
+                        output.put(f"{site}: 连通异常\n")
                 except:
-                    text_widget.insert(tk.END, f"{site}: 测试失败\n")
+                    output.put(f"{site}: 测试失败\n")
             
             # 5. 网络适配器状态
-            text_widget.insert(tk.END, "\n=== 网络适配器状态 ===\n")
+            output.put("\n=== 网络适配器状态 ===\n")
             try:
-                result = subprocess.run('netsh interface show interface', 
-                                       shell=True, capture_output=True, text=True, 
-                                       creationflags=subprocess.CREATE_NO_WINDOW)
+                result = self.run_command('netsh interface show interface')
                 if result.returncode == 0:
-                    text_widget.insert(tk.END, result.stdout)
+                    output.put(result.stdout)
                 else:
-                    text_widget.insert(tk.END, "无法获取网络适配器状态\n")
+                    output.put("无法获取网络适配器状态\n")
             except:
-                text_widget.insert(tk.END, "无法获取网络适配器状态\n")
-            
-            # 设置文本框为只读
-            text_widget.config(state=tk.DISABLED)
-            
-            # 添加关闭按钮
-            ttk.Button(dialog, text="关闭", command=dialog.destroy).pack(pady=10)
-            
-            self.log_info("网络诊断完成")
-            
+                output.put("无法获取网络适配器状态\n")
         except Exception as e:
-            error_msg = f"执行网络诊断时发生错误:\n{str(e)}"
+            error_msg = f"执行网络诊断时发生错误: {e}"
             self.log_error(error_msg)
-            messagebox.showerror("错误", error_msg)
-    
+            output.put(f"\n{error_msg}\n")
+        finally:
+            output.put(None)
+
+    def show_diagnosis_output(self, dialog, text_widget, output):
+        """把后台诊断的输出追加到对话框中，诊断结束后设为只读并显示关闭按钮"""
+        import queue
+        if not dialog.winfo_exists():
+            return
+        try:
+            while True:
+                text = output.get_nowait()
+                if text is None:
+                    # 设置文本框为只读
+                    text_widget.config(state=tk.DISABLED)
+                    
+                    # 添加关闭按钮
+                    ttk.Button(dialog, text="关闭", command=dialog.destroy).pack(pady=10)
+                    self.log_info("网络诊断完成")
+                    return
+                text_widget.insert(tk.END, text)
+                text_widget.see(tk.END)
+        except queue.Empty:
+            pass
+        dialog.after(100, self.show_diagnosis_output, dialog, text_widget, output)
+
     def get_current_ip(self):
         """获取当前网络IP信息"""
         try:
@@ -690,7 +2118,7 @@ class VirtualIPSwitcher:
                         
                         if service['type'] == 'simple':
                             # 简单服务直接返回IP
-                            if self.is_valid_ip(content):
+                            if parse_ip_address(content) is not None:
                                 self.log_info(f"获取公网IP成功: {content}")
                                 return content
                         elif service['type'] == 'json':
@@ -698,7 +2126,7 @@ class VirtualIPSwitcher:
                             try:
                                 data = json.loads(content)
                                 ip = data.get(service['field'], '')
-                                if self.is_valid_ip(ip):
+                                if parse_ip_address(ip) is not None:
                                     self.log_info(f"获取公网IP成功: {ip}")
                                     return ip
                             except:
@@ -725,9 +2153,1209 @@ class VirtualIPSwitcher:
     def on_closing(self):
         """关闭应用程序时的处理"""
         self.log_info("应用程序关闭")
-        self.save_config()
+        # 只有存在未保存的修改时才写文件，避免覆盖外部修改过的配置
+        if self.config_is_dirty():
+            self.save_config()
+        self.config_watcher.close()
         self.root.destroy()
 
+PROFILE_FIELDS = ["name", "ip", "subnet", "gateway", "dns"]
+TEMPLATE_FIELDS = ["type", "ip_end", "name_pattern"]
+
+def is_profile_stream_file(file_path):
+    """是否为逐行处理的CSV/JSON Lines文件"""
+    return os.path.splitext(file_path)[1].lower() in (".csv", ".jsonl")
+
+def write_profile_rows(file_path, profiles):
+    """将配置逐行写入CSV或JSON Lines文件"""
+    import csv
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        if file_path.lower().endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=PROFILE_FIELDS + TEMPLATE_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for profile in profiles:
+                writer.writerow(profile)
+        else:
+            for profile in profiles:
+                f.write(json.dumps(profile, ensure_ascii=False) + "\n")
+
+class ProfileStreamImporter:
+    """分块读取并校验CSV/JSON Lines配置，按名称合并到现有配置列表"""
+    def __init__(self, profiles, chunk_size=1000, max_errors=100):
+        self.profiles = profiles
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.name_index = {profile["name"]: i for i, profile in enumerate(profiles)}
+        self.rows = 0
+        self.added = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []  # 只保留前 max_errors 条错误信息
+
+    def iter_rows(self, file_path):
+        """逐行产生 (行号, 原始行字典)，JSON解析失败的行产生 (行号, None)"""
+        import csv
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            if file_path.lower().endswith(".csv"):
+                reader = csv.DictReader(f)
+                for row in reader:
+                    yield reader.line_num, row
+            else:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield line_number, row if isinstance(row, dict) else None
+
+    def validate_row(self, row):
+        """校验一行数据，返回 (配置字典, 错误信息)"""
+        if row is None:
+            return None, "无法解析的行"
+        if is_dhcp(row):
+            name = str(row.get("name") or "").strip()
+            if not name:
+                return None, "缺少必需字段（name）"
+            return {"name": name, "type": "dhcp"}, None
+        fields = PROFILE_FIELDS + TEMPLATE_FIELDS if is_template(row) else PROFILE_FIELDS
+        profile = {field: str(row.get(field) or "").strip() for field in fields}
+        if not profile["name"] or not profile["ip"] or not profile["subnet"] or not profile["gateway"]:
+            return None, "缺少必需字段（name、ip、subnet、gateway）"
+        return profile, check_ip_config(profile)
+
+    def add_error(self, line_number, message):
+        """记录一行错误"""
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"第{line_number}行: {message.splitlines()[0]}")
+
+    def merge(self, profile):
+        """按名称合并：同名配置更新，否则追加"""
+        index = self.name_index.get(profile["name"])
+        if index is None:
+            self.name_index[profile["name"]] = len(self.profiles)
+            self.profiles.append(profile)
+            self.added += 1
+        else:
+            self.profiles[index] = profile
+            self.updated += 1
+
+    def import_file(self, file_path):
+        """导入文件，每处理完一块产生一次已处理行数，用于显示进度"""
+        chunk = []
+        for line_number, row in self.iter_rows(file_path):
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                self.process_chunk(chunk)
+                chunk = []
+                yield self.rows
+        if chunk:
+            self.process_chunk(chunk)
+        yield self.rows
+
+    def process_chunk(self, chunk):
+        """校验并合并一块数据"""
+        for line_number, row in chunk:
+            self.rows += 1
+            profile, error = self.validate_row(row)
+            if error:
+                self.add_error(line_number, error)
+            else:
+                self.merge(profile)
+
+DEFAULT_PROBE_TARGETS = ["https://www.baidu.com", "https://www.github.com"]
+
+class ConnectivityProbe:
+    """分阶段连通性探测：分别计时DNS解析、TCP连接、TLS握手和首字节时间
+
+    目标可以是URL字符串（http://、https://、tcp://host:port），也可以是
+    {"url": ..., "verify": False} 形式的字典（verify 控制是否校验TLS证书）。
+    缺少主机名或端口的目标不会探测，failed_phase 为 "target"。
+    """
+    PHASES = ("dns", "tcp", "tls", "ttfb")
+    PHASE_NAMES = {"dns": "DNS", "tcp": "TCP", "tls": "TLS", "ttfb": "首字节"}
+
+    def __init__(self, timeouts=None, max_workers=8):
+        self.timeouts = {"dns": 3.0, "tcp": 3.0, "tls": 5.0, "ttfb": 5.0}
+        self.timeouts.update(timeouts or {})
+        self.max_workers = max_workers
+
+    def resolve(self, host, port):
+        """在独立线程中解析域名，以便对解析阶段设置超时"""
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(socket.getaddrinfo, host, port, 0, socket.SOCK_STREAM)
+            return future.result(timeout=self.timeouts["dns"])
+        finally:
+            executor.shutdown(wait=False)
+
+    def probe(self, target):
+        """探测单个目标，返回各阶段耗时（毫秒）和出错阶段"""
+        import ssl
+        import time
+        from concurrent.futures import TimeoutError as FutureTimeout
+        from urllib.parse import urlsplit
+        if isinstance(target, dict):
+            url, verify = target["url"], target.get("verify", True)
+        else:
+            url, verify = target, True
+        result = {"target": url, "ok": False, "address": "", "failed_phase": None, "error": "",
+                  "phases": dict.fromkeys(self.PHASES)}
+        # 没有协议的目标（如 "www.baidu.com"）解析不出主机名，getaddrinfo(None) 会得到本机回环地址
+        try:
+            parts = urlsplit(url)
+            scheme = parts.scheme or "tcp"
+            port = parts.port or {"http": 80, "https": 443}.get(scheme, 0)
+        except ValueError as e:
+            parts, port = None, 0
+            result["error"] = f"端口无效（{e}）"
+        if parts is not None and not parts.hostname:
+            result["error"] = "缺少主机名，请使用 http://、https:// 或 tcp://主机:端口 的形式"
+        elif parts is not None and not port:
+            result["error"] = "缺少端口，tcp:// 目标需要写成 tcp://主机:端口"
+        if result["error"]:
+            result["failed_phase"] = "target"
+            return result
+        phase = "dns"
+        sock = None
+        try:
+            start = time.perf_counter()
+            family, _, _, _, address = self.resolve(parts.hostname, port)[0]
+            result["phases"]["dns"] = round((time.perf_counter() - start) * 1000, 1)
+            result["address"] = address[0]
+
+            phase = "tcp"
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeouts["tcp"])
+            start = time.perf_counter()
+            sock.connect(address)
+            result["phases"]["tcp"] = round((time.perf_counter() - start) * 1000, 1)
+
+            if scheme == "https":
+                phase = "tls"
+                context = ssl.create_default_context()
+                if not verify:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                sock.settimeout(self.timeouts["tls"])
+                start = time.perf_counter()
+                sock = context.wrap_socket(sock, server_hostname=parts.hostname)
+                result["phases"]["tls"] = round((time.perf_counter() - start) * 1000, 1)
+
+            if scheme in ("http", "https"):
+                phase = "ttfb"
+                sock.settimeout(self.timeouts["ttfb"])
+                request = (f"GET {parts.path or '/'} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+                           f"User-Agent: VirtualIPSwitcher\r\nConnection: close\r\n\r\n")
+                start = time.perf_counter()
+                sock.sendall(request.encode('ascii'))
+                if not sock.recv(1):
+                    raise ConnectionError("服务器关闭了连接")
+                result["phases"]["ttfb"] = round((time.perf_counter() - start) * 1000, 1)
+            result["ok"] = True
+        except (FutureTimeout, socket.timeout):
+            result["failed_phase"], result["error"] = phase, f"超时（{self.timeouts[phase]}秒）"
+        except Exception as e:
+            result["failed_phase"], result["error"] = phase, str(e) or e.__class__.__name__
+        finally:
+            if sock is not None:
+                sock.close()
+        return result
+
+    def run(self, targets):
+        """并发探测所有目标，按目标顺序返回结果"""
+        from concurrent.futures import ThreadPoolExecutor
+        if not targets:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as executor:
+            return list(executor.map(self.probe, targets))
+
+    @classmethod
+    def format_result(cls, result):
+        """单个探测结果的显示文本"""
+        timings = " | ".join(f"{cls.PHASE_NAMES[phase]} {value:g} ms"
+                             for phase, value in result["phases"].items() if value is not None)
+        if result["ok"]:
+            return f"{result['target']}: {timings}"
+        if result["failed_phase"] == "target":
+            return f"{result['target']}: 目标无效: {result['error']}"
+        failed = f"{cls.PHASE_NAMES[result['failed_phase']]}阶段失败: {result['error']}"
+        return f"{result['target']}: {timings + ' | ' if timings else ''}{failed}"
+
+def format_rate(bytes_per_second):
+    """速率的显示文本"""
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.0f} {unit}"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} GB/s"
+
+def read_proc_net_dev(adapter_name, path="/proc/net/dev"):
+    """从 /proc/net/dev 读取网卡计数器"""
+    with open(path, 'r') as f:
+        for line in f:
+            name, sep, data = line.partition(':')
+            if sep and name.strip() == adapter_name:
+                fields = [int(value) for value in data.split()]
+                # 接收: bytes packets errs drop ...；发送从第9个字段开始
+                return {"rx_bytes": fields[0], "rx_packets": fields[1], "tx_bytes": fields[8],
+                        "tx_packets": fields[9], "errors": fields[2] + fields[10]}
+    return None
+
+class GratuitousArpSender:
+    """发送免费ARP通告
+
+    Linux 通过 AF_PACKET 原始套接字广播 ARP 请求（发送方和目标地址都是新地址）；
+    Windows 没有二层发送接口，使用 SendARP 以新地址为源向网关发出 ARP 请求，
+    使网关更新对应的缓存项。
+    """
+    def __init__(self, adapter_name, ip, gateway=""):
+        self.ip = ip
+        self.gateway = gateway
+        self.sock = None
+        if os.name == 'nt':
+            self.iphlpapi = ctypes.WinDLL("iphlpapi")
+            return
+        import struct
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0806))
+        self.sock.bind((adapter_name, 0))
+        mac = self.sock.getsockname()[4]
+        ip_bytes = socket.inet_aton(ip)
+        # 以太网头 + ARP请求（硬件类型1，协议0x0800，操作码1），补齐到最小帧长60字节
+        frame = (b"\xff" * 6 + mac + struct.pack("!H", 0x0806) +
+                 struct.pack("!HHBBH", 1, 0x0800, 6, 4, 1) + mac + ip_bytes + b"\x00" * 6 + ip_bytes)
+        self.frame = frame.ljust(60, b"\x00")
+
+    def send(self):
+        """发送一次通告"""
+        if self.sock is not None:
+            self.sock.send(self.frame)
+        elif self.gateway:
+            mac = (ctypes.c_ubyte * 8)()
+            length = ctypes.c_ulong(8)
+            self.iphlpapi.SendARP(int.from_bytes(socket.inet_aton(self.gateway), 'little'),
+                                  int.from_bytes(socket.inet_aton(self.ip), 'little'), mac, ctypes.byref(length))
+
+    def close(self):
+        """关闭套接字"""
+        if self.sock is not None:
+            self.sock.close()
+
+class ArpResolver:
+    """发送ARP请求解析IP地址对应的MAC地址
+
+    Linux 通过 AF_PACKET 原始套接字发送发送方地址为 0.0.0.0 的ARP探测（RFC 5227），
+    网卡上还是其他网络的地址时也能收到应答；Windows 使用 SendARP，
+    只能解析与网卡当前地址在同一子网的主机。
+    """
+    def __init__(self, adapter_name):
+        self.sock = None
+        if os.name == 'nt':
+            self.iphlpapi = ctypes.WinDLL("iphlpapi")
+            return
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0806))
+        self.sock.bind((adapter_name, 0))
+        self.mac = self.sock.getsockname()[4]
+
+    def resolve(self, ips, timeout):
+        """向每个地址发出ARP请求，返回超时前应答的 {IP: MAC}"""
+        if self.sock is None:
+            return self.resolve_windows(ips, timeout)
+        import select
+        import struct
+        import time
+        for ip in ips:
+            frame = (b"\xff" * 6 + self.mac + struct.pack("!H", 0x0806) +
+                     struct.pack("!HHBBH", 1, 0x0800, 6, 4, 1) + self.mac + b"\x00" * 4 +
+                     b"\x00" * 6 + socket.inet_aton(ip))
+            self.sock.send(frame.ljust(60, b"\x00"))
+        found = {}
+        deadline = time.monotonic() + timeout
+        while len(found) < len(ips):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]:
+                break
+            packet = self.sock.recv(2048)
+            # ARP应答（操作码2）：发送方MAC在第22~27字节，发送方IP在第28~31字节
+            if len(packet) < 42 or struct.unpack("!H", packet[20:22])[0] != 2:
+                continue
+            sender_ip = socket.inet_ntoa(packet[28:32])
+            if sender_ip in ips:
+                found[sender_ip] = packet[22:28].hex(':')
+        return found
+
+    def resolve_windows(self, ips, timeout):
+        """在各自的线程中调用 SendARP（调用会阻塞且不能取消），收集超时前的结果"""
+        import queue
+        import threading
+        import time
+        results = queue.Queue()
+
+        def worker(ip):
+            mac = (ctypes.c_ubyte * 8)()
+            length = ctypes.c_ulong(8)
+            if self.iphlpapi.SendARP(int.from_bytes(socket.inet_aton(ip), 'little'), 0, mac, ctypes.byref(length)) == 0:
+                results.put((ip, bytes(mac[:length.value]).hex(':')))
+            else:
+                results.put((ip, ""))
+
+        for ip in ips:
+            threading.Thread(target=worker, args=(ip,), daemon=True).start()
+        found = {}
+        deadline = time.monotonic() + timeout
+        for _ in ips:
+            try:
+                ip, mac = results.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if mac:
+                found[ip] = mac
+        return found
+
+    def close(self):
+        """关闭套接字"""
+        if self.sock is not None:
+            self.sock.close()
+
+class DhcpClient:
+    """最小的DHCP客户端（Linux）：在指定网卡上完成 DISCOVER/OFFER/REQUEST/ACK，返回租约参数
+
+    请求通过 AF_PACKET 套接字以源地址 0.0.0.0 广播；请求中设置广播标志，
+    服务器的应答以广播发回，由绑定到该网卡的UDP套接字接收，不需要网卡预先有地址。
+    """
+    SERVER_PORT = 67
+    CLIENT_PORT = 68
+    MAGIC_COOKIE = b"\x63\x82\x53\x63"
+    DISCOVER, OFFER, REQUEST, ACK, NAK = 1, 2, 3, 5, 6
+
+    def __init__(self, adapter_name):
+        import random
+        self.adapter_name = adapter_name
+        self.xid = random.getrandbits(32)
+        self.raw = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.raw.bind((adapter_name, 0x0800))
+            self.mac = self.raw.getsockname()[4]
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, adapter_name.encode())
+            self.sock.bind(("", self.CLIENT_PORT))
+        except OSError:
+            self.close()
+            raise
+
+    def send(self, payload):
+        """以 0.0.0.0:68 -> 255.255.255.255:67 广播一个UDP报文"""
+        import struct
+        udp = struct.pack("!HHHH", self.CLIENT_PORT, self.SERVER_PORT, 8 + len(payload), 0) + payload
+        header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, socket.IPPROTO_UDP, 0,
+                             b"\x00" * 4, b"\xff" * 4)
+        total = sum(struct.unpack("!10H", header))
+        while total > 0xFFFF:
+            total = (total & 0xFFFF) + (total >> 16)
+        header = header[:10] + struct.pack("!H", ~total & 0xFFFF) + header[12:]
+        self.raw.send(b"\xff" * 6 + self.mac + struct.pack("!H", 0x0800) + header + udp)
+
+    def build(self, message_type, requested_ip=None, server=None):
+        """构造DHCP请求报文"""
+        import struct
+        packet = struct.pack("!BBBBIHH4s4s4s4s16s64s128s", 1, 1, 6, 0, self.xid, 0, 0x8000,
+                             b"\x00" * 4, b"\x00" * 4, b"\x00" * 4, b"\x00" * 4, self.mac, b"", b"")
+        options = bytes([53, 1, message_type, 61, 7, 1]) + self.mac
+        if requested_ip:
+            options += bytes([50, 4]) + socket.inet_aton(requested_ip)
+        if server:
+            options += bytes([54, 4]) + socket.inet_aton(server)
+        # 请求参数：子网掩码、路由器、DNS、租期
+        options += bytes([55, 4, 1, 3, 6, 51, 255])
+        return packet + self.MAGIC_COOKIE + options
+
+    def parse(self, data):
+        """解析应答报文，返回 (分配的地址, 选项字典)；不是本次交互的应答时返回 None"""
+        import struct
+        if len(data) < 240 or data[0] != 2 or data[236:240] != self.MAGIC_COOKIE:
+            return None
+        if struct.unpack("!I", data[4:8])[0] != self.xid:
+            return None
+        options = {}
+        position = 240
+        while position < len(data) and data[position] != 255:
+            code = data[position]
+            if code == 0:
+                position += 1
+                continue
+            if position + 1 >= len(data):
+                break
+            length = data[position + 1]
+            options[code] = data[position + 2:position + 2 + length]
+            position += 2 + length
+        return socket.inet_ntoa(data[16:20]), options
+
+    def exchange(self, packet, expected_type, deadline):
+        """发送请求并等待指定类型的应答（每秒重发一次），超时返回 None"""
+        import time
+        while time.perf_counter() < deadline:
+            self.send(packet)
+            resend_at = min(deadline, time.perf_counter() + 1)
+            while True:
+                remaining = resend_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.sock.settimeout(remaining)
+                try:
+                    data = self.sock.recv(4096)
+                except socket.timeout:
+                    break
+                reply = self.parse(data)
+                if reply is None or 53 not in reply[1]:
+                    continue
+                message_type = reply[1][53][0]
+                if message_type == self.NAK:
+                    raise ValueError("DHCP服务器拒绝了地址请求")
+                if message_type == expected_type:
+                    return reply
+        return None
+
+    def acquire(self, timeout):
+        """获取租约，返回 {"ip", "prefix", "subnet", "gateway", "dns", "server", "lease_time"}；超时返回 None"""
+        import struct
+        import time
+        deadline = time.perf_counter() + timeout
+        offer = self.exchange(self.build(self.DISCOVER), self.OFFER, deadline)
+        if offer is None:
+            return None
+        offered_ip, options = offer
+        server = socket.inet_ntoa(options[54]) if len(options.get(54, b"")) == 4 else None
+        ack = self.exchange(self.build(self.REQUEST, offered_ip, server), self.ACK, deadline)
+        if ack is None:
+            return None
+        ip, options = ack
+        mask = socket.inet_ntoa(options[1]) if len(options.get(1, b"")) == 4 else "255.255.255.0"
+        routers = options.get(3, b"")
+        dns = options.get(6, b"")
+        return {
+            "ip": ip,
+            "prefix": parse_subnet_prefix(mask),
+            "subnet": mask,
+            "gateway": socket.inet_ntoa(routers[:4]) if len(routers) >= 4 else "",
+            "dns": ",".join(socket.inet_ntoa(dns[i:i + 4]) for i in range(0, len(dns) - 3, 4)),
+            "server": socket.inet_ntoa(options[54]) if len(options.get(54, b"")) == 4 else server or "",
+            "lease_time": struct.unpack("!I", options[51])[0] if len(options.get(51, b"")) == 4 else None
+        }
+
+    def close(self):
+        """关闭套接字"""
+        self.raw.close()
+        self.sock.close()
+
+class InterfaceCounterReader:
+    """读取网卡的字节、包和错误计数（Windows 使用 GetIfEntry2，Linux 使用 /proc/net/dev）"""
+    def __init__(self, adapter_name):
+        self.adapter_name = adapter_name
+        self.row = None
+        if os.name == 'nt':
+            self.row = self.open_windows_row(adapter_name)
+
+    def open_windows_row(self, adapter_name):
+        """根据网卡名称查出 LUID，返回可重复用于 GetIfEntry2 的 MIB_IF_ROW2；失败时返回 None"""
+        try:
+            self.iphlpapi = ctypes.WinDLL("iphlpapi")
+            self.iphlpapi.ConvertInterfaceAliasToLuid.argtypes = [ctypes.c_wchar_p, ctypes.POINTER(ctypes.c_uint64)]
+            self.iphlpapi.ConvertInterfaceAliasToLuid.restype = ctypes.c_ulong
+            self.iphlpapi.GetIfEntry2.argtypes = [ctypes.POINTER(MIB_IF_ROW2)]
+            self.iphlpapi.GetIfEntry2.restype = ctypes.c_ulong
+            luid = ctypes.c_uint64()
+            if self.iphlpapi.ConvertInterfaceAliasToLuid(adapter_name, ctypes.byref(luid)) != 0:
+                return None
+        except (OSError, AttributeError):
+            return None
+        row = MIB_IF_ROW2()
+        row.InterfaceLuid = luid.value
+        return row
+
+    def read(self):
+        """读取一次计数器；网卡不存在时返回 None"""
+        try:
+            if os.name != 'nt':
+                return read_proc_net_dev(self.adapter_name)
+            if self.row is None or self.iphlpapi.GetIfEntry2(ctypes.byref(self.row)) != 0:
+                return None
+            row = self.row
+            return {"rx_bytes": row.InOctets, "rx_packets": row.InUcastPkts + row.InNUcastPkts,
+                    "tx_bytes": row.OutOctets, "tx_packets": row.OutUcastPkts + row.OutNUcastPkts,
+                    "errors": row.InErrors + row.OutErrors}
+        except (OSError, ValueError, IndexError):
+            return None
+
+class MIB_IF_ROW2(ctypes.Structure):
+    """Windows netioapi.h 中的 MIB_IF_ROW2 结构"""
+    _fields_ = [
+        ("InterfaceLuid", ctypes.c_uint64),
+        ("InterfaceIndex", ctypes.c_uint32),
+        ("InterfaceGuid", ctypes.c_uint32 * 4),
+        ("Alias", ctypes.c_uint16 * 257),
+        ("Description", ctypes.c_uint16 * 257),
+        ("PhysicalAddressLength", ctypes.c_uint32),
+        ("PhysicalAddress", ctypes.c_ubyte * 32),
+        ("PermanentPhysicalAddress", ctypes.c_ubyte * 32),
+        ("Mtu", ctypes.c_uint32),
+        ("Type", ctypes.c_uint32),
+        ("TunnelType", ctypes.c_uint32),
+        ("MediaType", ctypes.c_uint32),
+        ("PhysicalMediumType", ctypes.c_uint32),
+        ("AccessType", ctypes.c_uint32),
+        ("DirectionType", ctypes.c_uint32),
+        ("InterfaceAndOperStatusFlags", ctypes.c_ubyte),
+        ("OperStatus", ctypes.c_uint32),
+        ("AdminStatus", ctypes.c_uint32),
+        ("MediaConnectState", ctypes.c_uint32),
+        ("NetworkGuid", ctypes.c_uint32 * 4),
+        ("ConnectionType", ctypes.c_uint32),
+        ("TransmitLinkSpeed", ctypes.c_uint64),
+        ("ReceiveLinkSpeed", ctypes.c_uint64),
+        ("InOctets", ctypes.c_uint64),
+        ("InUcastPkts", ctypes.c_uint64),
+        ("InNUcastPkts", ctypes.c_uint64),
+        ("InDiscards", ctypes.c_uint64),
+        ("InErrors", ctypes.c_uint64),
+        ("InUnknownProtos", ctypes.c_uint64),
+        ("InUcastOctets", ctypes.c_uint64),
+        ("InMulticastOctets", ctypes.c_uint64),
+        ("InBroadcastOctets", ctypes.c_uint64),
+        ("OutOctets", ctypes.c_uint64),
+        ("OutUcastPkts", ctypes.c_uint64),
+        ("OutNUcastPkts", ctypes.c_uint64),
+        ("OutDiscards", ctypes.c_uint64),
+        ("OutErrors", ctypes.c_uint64),
+        ("OutUcastOctets", ctypes.c_uint64),
+        ("OutMulticastOctets", ctypes.c_uint64),
+        ("OutBroadcastOctets", ctypes.c_uint64),
+        ("OutQLen", ctypes.c_uint64),
+    ]
+
+class ThroughputSampler:
+    """在固定长度的环形缓冲区中保存计数器采样，并计算相邻采样间的速率"""
+    def __init__(self, size=120):
+        from collections import deque
+        self.samples = deque(maxlen=size)  # (时间, rx_bytes, tx_bytes, 包总数, 错误数)
+
+    def clear(self):
+        """清空采样（切换网卡时使用）"""
+        self.samples.clear()
+
+    def add(self, timestamp, counters):
+        """追加一次采样"""
+        self.samples.append((timestamp, counters["rx_bytes"], counters["tx_bytes"],
+                             counters["rx_packets"] + counters["tx_packets"], counters["errors"]))
+
+    def rates(self):
+        """返回每个采样间隔的 (接收字节/秒, 发送字节/秒, 包/秒, 错误/秒)，计数器回绕时按0计"""
+        result = []
+        previous = None
+        for sample in self.samples:
+            if previous is not None and sample[0] > previous[0]:
+                elapsed = sample[0] - previous[0]
+                result.append(tuple(max(0, sample[i] - previous[i]) / elapsed for i in range(1, 5)))
+            previous = sample
+        return result
+
+class LatencyHistory:
+    """每个 (配置, 目标) 的延迟历史，使用固定长度的环形缓冲区保存最近的测量结果
+
+    每条记录为 [时间戳, p50, p95, 丢包率]，保存在配置文件旁边。
+    """
+    def __init__(self, path, size=60):
+        from collections import deque
+        self.path = path
+        self.size = size
+        self.buffers = {}  # "配置名称|目标" -> deque
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for key, records in json.load(f).items():
+                        self.buffers[key] = deque(records, maxlen=size)
+            except Exception:
+                self.buffers = {}
+
+    def record(self, profile_name, target, stats):
+        """追加一次测量结果，超出容量时自动丢弃最旧的记录"""
+        from collections import deque
+        import time
+        key = f"{profile_name}|{target}"
+        if key not in self.buffers:
+            self.buffers[key] = deque(maxlen=self.size)
+        self.buffers[key].append([int(time.time()), stats["p50"], stats["p95"], stats["loss"]])
+
+    def samples(self, profile_name, target):
+        """返回按时间排序的记录列表"""
+        return list(self.buffers.get(f"{profile_name}|{target}", ()))
+
+    def save(self):
+        """保存到文件"""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({key: list(records) for key, records in self.buffers.items()}, f, separators=(',', ':'))
+
+class ConfigFileWatcher:
+    """监视配置文件的变化
+
+    Linux 使用 inotify，Windows 使用目录变更通知，其他情况（或初始化失败时）
+    轮询文件的修改时间和大小。poll() 不会阻塞，只表示文件可能有变化，
+    是否真的变化由调用方比较文件内容。
+    """
+    IN_CLOSE_WRITE = 0x08
+    IN_MOVED_TO = 0x80
+    IN_DELETE = 0x200
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.directory, self.name = os.path.split(self.path)
+        self.mode = "poll"
+        self.signature = self.stat_signature()
+        try:
+            if sys.platform.startswith("linux"):
+                self.open_inotify()
+            elif os.name == 'nt':
+                self.open_windows_notification()
+        except (OSError, AttributeError):
+            self.mode = "poll"
+
+    def stat_signature(self):
+        """文件的 (修改时间, 大小)，文件不存在时返回 None"""
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def open_inotify(self):
+        """创建非阻塞的 inotify 实例，监视配置文件所在目录"""
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch 失败")
+        self.fd = fd
+        self.mode = "inotify"
+
+    def open_windows_notification(self):
+        """创建目录变更通知句柄（文件名、大小、写入时间变化）"""
+        kernel32 = ctypes.WinDLL("kernel32")
+        kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+        kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+        # FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE
+        handle = kernel32.FindFirstChangeNotificationW(self.directory, False, 0x01 | 0x08 | 0x10)
+        if handle is None or handle == ctypes.c_void_p(-1).value:
+            raise OSError("FindFirstChangeNotification 失败")
+        self.kernel32 = kernel32
+        self.handle = handle
+        self.mode = "windows"
+
+    def poll(self):
+        """检查配置文件是否可能有变化（不阻塞）"""
+        import struct
+        if self.mode == "inotify":
+            changed = False
+            while True:
+                try:
+                    data = os.read(self.fd, 4096)
+                except BlockingIOError:
+                    break
+                offset = 0
+                # struct inotify_event { int wd; uint32 mask, cookie, len; char name[len]; }
+                while offset + 16 <= len(data):
+                    length = struct.unpack_from("iIII", data, offset)[3]
+                    if data[offset + 16:offset + 16 + length].rstrip(b"\0") == os.fsencode(self.name):
+                        changed = True
+                    offset += 16 + length
+            return changed
+        if self.mode == "windows":
+            if self.kernel32.WaitForSingleObject(self.handle, 0) != 0:
+                return False
+            self.kernel32.FindNextChangeNotification(self.handle)
+        signature = self.stat_signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+    def close(self):
+        """释放监视资源"""
+        if self.mode == "inotify":
+            os.close(self.fd)
+        elif self.mode == "windows":
+            self.kernel32.FindCloseChangeNotification(self.handle)
+        self.mode = "poll"
+
+class NetworkFingerprintIndex:
+    """网络指纹索引：指纹 -> 配置名称，保存在配置文件旁边"""
+    def __init__(self, path):
+        self.path = path
+        self.fingerprints = {}   # 完整指纹 -> 配置名称
+        self.gateway_macs = {}   # 网关MAC -> 配置名称
+        self.ssids = {}          # SSID -> 配置名称
+        self.gateway_ips = {}    # 网关MAC -> 网关IP（网卡接入时据此主动解析网关MAC）
+        self.load()
+
+    @staticmethod
+    def make_key(fingerprint):
+        """将指纹转换为索引键"""
+        return "|".join([fingerprint.get("gateway_mac", ""), fingerprint.get("subnet", ""), fingerprint.get("ssid", "")])
+
+    def load(self):
+        """加载已学习的指纹"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.fingerprints = data.get("fingerprints", {})
+            self.gateway_macs = data.get("gateway_macs", {})
+            self.ssids = data.get("ssids", {})
+            self.gateway_ips = data.get("gateway_ips", {})
+        except Exception:
+            # 索引损坏时重新学习即可
+            self.fingerprints, self.gateway_macs, self.ssids, self.gateway_ips = {}, {}, {}, {}
+
+    def save(self):
+        """保存已学习的指纹"""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "fingerprints": self.fingerprints,
+                "gateway_macs": self.gateway_macs,
+                "ssids": self.ssids,
+                "gateway_ips": self.gateway_ips
+            }, f, ensure_ascii=False, indent=2)
+
+    def learn(self, fingerprint, profile_name):
+        """记录指纹对应的配置，返回索引是否有变化（没有网关MAC和SSID的指纹不记录）"""
+        if not fingerprint.get("gateway_mac") and not fingerprint.get("ssid"):
+            return False
+        changed = False
+        entries = [(self.fingerprints, self.make_key(fingerprint), profile_name),
+                   (self.gateway_macs, fingerprint.get("gateway_mac"), profile_name),
+                   (self.ssids, fingerprint.get("ssid"), profile_name)]
+        if fingerprint.get("gateway_ip"):
+            entries.append((self.gateway_ips, fingerprint.get("gateway_mac"), fingerprint["gateway_ip"]))
+        for index, key, value in entries:
+            if key and index.get(key) != value:
+                index[key] = value
+                changed = True
+        return changed
+
+    def lookup(self, fingerprint):
+        """按 完整指纹 -> 网关MAC -> SSID 的顺序查找配置名称
+
+        子网来自网卡自身的配置，不能单独用来识别网络，没有网关MAC和SSID时不匹配。
+        """
+        if not fingerprint.get("gateway_mac") and not fingerprint.get("ssid"):
+            return None
+        name = self.fingerprints.get(self.make_key(fingerprint))
+        if name is None and fingerprint.get("gateway_mac"):
+            name = self.gateway_macs.get(fingerprint["gateway_mac"])
+        if name is None and fingerprint.get("ssid"):
+            name = self.ssids.get(fingerprint["ssid"])
+        return name
+
+LOG_FILE = os.path.join("logs", "virtual_ip_switcher.log")
+LOG_BACKUP_COUNT = 5
+
+class LogFileIndex:
+    """单个日志文件的记录索引：只保存每条记录的起始偏移、时间和级别
+
+    不以时间戳开头的行（如异常堆栈）属于上一条记录。内容在显示时按偏移读取；
+    每次读取后立即关闭映射和文件，否则 Windows 上日志轮转时无法重命名文件。
+    """
+    RECORD_PATTERN = re.compile(rb'^(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d),(\d{3}) - [^\n]*? - '
+                                rb'(DEBUG|INFO|WARNING|ERROR|CRITICAL) - ', re.M)
+    LEVELS = {b"DEBUG": 1, b"INFO": 2, b"WARNING": 3, b"ERROR": 4, b"CRITICAL": 5}
+    HEAD_SIZE = 64
+
+    def __init__(self, path):
+        from array import array
+        self.path = path
+        self.head = b""  # 文件开头的内容，用于在轮转改名后识别文件
+        self.size = 0  # 已索引的字节数（到最后一个完整行为止）
+        self.starts = array('q')
+        self.times = array('q')  # 时间戳数字，如 20240101120000123
+        self.levels = bytearray()  # 0 表示无法识别的内容
+        self.keywords = {}  # 关键字 -> 包含该关键字的记录序号（首次查询时建立）
+
+    def update(self):
+        """增量索引文件新增的完整行，返回新增的记录数；文件被截断或替换时返回 None"""
+        import mmap
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.size:
+                return None
+            if size == self.size:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(self.head)] != self.head:
+                    return None
+                stop = data.rfind(b"\n", self.size, size) + 1
+                if stop <= self.size:
+                    return 0
+                first = len(self.starts)
+                if not self.starts and not self.RECORD_PATTERN.match(data, 0):
+                    self.append(0, 0, 0)
+                for match in self.RECORD_PATTERN.finditer(data, self.size, stop):
+                    self.append(match.start(), int(b"".join(match.groups()[:7])), self.LEVELS[match.group(8)])
+                # 上一次的最后一条记录可能有新的后续行，从它开始补充关键字索引
+                begin = self.starts[first - 1] if first else 0
+                for keyword, records in self.keywords.items():
+                    self.scan_keyword(data, keyword, records, begin, stop)
+                self.size = stop
+                if len(self.head) < self.HEAD_SIZE:
+                    self.head = data[:self.HEAD_SIZE]
+        return len(self.starts) - first
+
+    def append(self, start, time_key, level):
+        """追加一条记录"""
+        self.starts.append(start)
+        self.times.append(time_key)
+        self.levels.append(level)
+
+    def scan_keyword(self, data, keyword, records, begin, stop):
+        """在 [begin, stop) 中查找关键字，把所在记录的序号追加到 records"""
+        import bisect
+        position = data.find(keyword, begin, stop)
+        while position >= 0:
+            number = bisect.bisect_right(self.starts, position) - 1
+            if not records or records[-1] < number:
+                records.append(number)
+            position = data.find(keyword, position + len(keyword), stop)
+
+    def records_with(self, keyword):
+        """包含关键字（如配置名称）的记录序号"""
+        import mmap
+        from array import array
+        records = self.keywords.get(keyword)
+        if records is None:
+            records = array('i')
+            if self.size:
+                with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.scan_keyword(data, keyword, records, 0, self.size)
+            self.keywords[keyword] = records
+        return records
+
+    def read(self, numbers):
+        """读取指定序号的记录，返回 [(级别, 文本), ...]"""
+        import mmap
+        lines = []
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(self.head)] != self.head:
+                raise ValueError("日志文件已轮转")
+            for number in numbers:
+                end = self.starts[number + 1] if number + 1 < len(self.starts) else self.size
+                text = data[self.starts[number]:end].decode('utf-8', errors='replace').rstrip('\r\n')
+                lines.append((self.levels[number], text))
+        return lines
+
+class LogIndex:
+    """跨轮转文件的日志索引，文件从旧到新：virtual_ip_switcher.log.5 … virtual_ip_switcher.log
+
+    文件按开头的内容识别，轮转改名后已有的索引继续使用，只需增量索引当前日志的新内容。
+    """
+    def __init__(self, path=LOG_FILE, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.backup_count = backup_count
+        self.files = []
+
+    @staticmethod
+    def time_key(text, upper=False):
+        """把 "2024-01-01 12:00:00" 之类的时间（可只写到日期或分钟）转换为索引中的时间数字"""
+        digits = re.sub(r'\D', '', text)
+        if not digits:
+            return None
+        if len(digits) < 8 or len(digits) > 17:
+            raise ValueError(f"时间格式不正确: {text}\n请使用 YYYY-MM-DD HH:MM:SS 格式")
+        return int(digits.ljust(17, '9' if upper else '0'))
+
+    def refresh(self):
+        """扫描日志文件并增量更新索引，返回索引是否有变化"""
+        paths = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)] + [self.path]
+        cached = list(self.files)
+        files = []
+        changed = False
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    head = f.read(LogFileIndex.HEAD_SIZE)
+            except OSError:
+                continue
+            index = next((c for c in cached if c.head and head.startswith(c.head)), None)
+            if index is None:
+                index = LogFileIndex(path)
+            else:
+                cached.remove(index)
+                if index.path != path:
+                    index.path = path
+                    changed = True
+            try:
+                added = index.update()
+                if added is None:
+                    index = LogFileIndex(path)
+                    index.update()
+                    changed = True
+                elif added:
+                    changed = True
+            except (OSError, ValueError):
+                # 读取期间文件刚好被轮转，下次刷新时再索引
+                changed = True
+                continue
+            files.append(index)
+        self.files = files
+        return changed or bool(cached)
+
+    def query(self, min_level=0, start=None, end=None, keyword=""):
+        """返回符合条件的记录 [(文件索引, 记录序号), ...]，从旧到新"""
+        import bisect
+        keyword = keyword.encode('utf-8')
+        results = []
+        for index in self.files:
+            low = bisect.bisect_left(index.times, start) if start else 0
+            high = bisect.bisect_right(index.times, end) if end else len(index.starts)
+            if low >= high:
+                continue
+            levels = index.levels
+            candidates = index.records_with(keyword) if keyword else range(low, high)
+            results.extend((index, number) for number in candidates
+                           if low <= number < high and levels[number] >= min_level)
+        return results
+
+    @staticmethod
+    def read(refs):
+        """读取 query 返回的记录，按文件分组读取"""
+        lines = []
+        group = []
+        for ref in refs:
+            if group and ref[0] is not group[0][0]:
+                lines.extend(group[0][0].read([number for _, number in group]))
+                group = []
+            group.append(ref)
+        if group:
+            lines.extend(group[0][0].read([number for _, number in group]))
+        return lines
+
+FLEET_PORT = 47800
+
+def is_loopback_address(host):
+    """是否为本机回环地址（localhost、127.0.0.0/8、::1）"""
+    if host == "localhost":
+        return True
+    parsed = parse_ip_address(host)
+    if parsed is None:
+        return False
+    return parsed[1] >> 24 == 127 if parsed[0] == 4 else parsed[1] == 1
+
+class FleetAgent:
+    """代理模式：监听TCP端口，执行控制端下发的 apply/status/diagnose 命令
+
+    协议为每行一个JSON对象：请求 {"command": ..., "token": ..., ...}，
+    响应 {"ok": bool, "message": str, "data": {...}}。
+    """
+    def __init__(self, app, host="0.0.0.0", port=FLEET_PORT, token=""):
+        import threading
+        self.app = app
+        self.host = host
+        self.port = port
+        self.token = token
+        self.lock = threading.Lock()  # 同一时间只执行一条网络命令
+        self.server = None
+
+    async def start(self):
+        """开始监听，返回实际监听的端口"""
+        import asyncio
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.app.log_info(f"代理已启动，监听 {self.host}:{self.port}")
+        return self.port
+
+    async def stop(self):
+        """停止监听"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.app.log_info("代理已停止")
+
+    async def serve_forever(self):
+        """启动并持续运行"""
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        """处理一个控制端连接"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    request = None
+                if isinstance(request, dict):
+                    response = await loop.run_in_executor(None, self.execute, request)
+                else:
+                    response = {"ok": False, "message": "无法解析的请求", "data": {}}
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def execute(self, request):
+        """执行一条请求并返回响应字典"""
+        import hmac
+        if self.token and not hmac.compare_digest(str(request.get("token", "")), self.token):
+            self.app.log_error("代理收到认证失败的请求")
+            return {"ok": False, "message": "认证失败", "data": {}}
+
+        # 配置文件可能已被更新（如由部署系统下发）
+        self.app.check_config_file()
+        command = request.get("command")
+        handlers = {"apply": self.do_apply, "status": self.do_status, "diagnose": self.do_diagnose}
+        if command not in handlers:
+            return {"ok": False, "message": f"未知命令: {command}", "data": {}}
+        with self.lock:
+            try:
+                return handlers[command](request)
+            except Exception as e:
+                error_msg = f"执行命令 {command} 时发生错误: {e}"
+                self.app.log_error(error_msg)
+                return {"ok": False, "message": error_msg, "data": {}}
+
+    def adapter_name(self, request):
+        """请求中指定的网卡，默认使用配置中的网卡"""
+        return request.get("adapter") or self.app.config.get("adapter_name", "以太网")
+
+    def do_apply(self, request):
+        """应用指定名称的IP配置"""
+        name = request.get("profile", "")
+        ip_config = self.app.find_profile(name, request.get("ip"))
+        if ip_config is None:
+            return {"ok": False, "message": f"未找到IP配置: {name}", "data": {}}
+        if is_template(ip_config):
+            return {"ok": False, "message": f"{name} 是范围模板，请用 ip 参数指定要应用的地址", "data": {}}
+        adapter_name = self.adapter_name(request)
+        if is_dhcp(ip_config):
+            success, message = self.app.apply_profile(ip_config, adapter_name)
+            data = dict(self.app.dhcp_leases[adapter_name], profile=name) if success else {"profile": name}
+            return {"ok": success, "message": message, "data": data}
+        if not request.get("force") and self.app.is_ip_in_use(ip_config["ip"]):
+            return {"ok": False, "message": f"IP地址 {ip_config['ip']} 可能已被使用（可使用 force 强制应用）", "data": {}}
+        success, message = self.app.apply_profile(ip_config, adapter_name)
+        return {"ok": success, "message": message, "data": {"profile": name, "ip": ip_config["ip"]}}
+
+    def do_status(self, request):
+        """返回网卡当前的IP信息"""
+        adapter_name = self.adapter_name(request)
+        data = self.app.get_adapter_ip_info(adapter_name)
+        data.update({"hostname": socket.gethostname(), "adapter": adapter_name})
+        return {"ok": True, "message": f"{adapter_name}: {data['ip'] or '无IP'}", "data": data}
+
+    def do_diagnose(self, request):
+        """检查网关连通性和DNS解析"""
+        adapter_name = self.adapter_name(request)
+        data = self.app.get_adapter_ip_info(adapter_name)
+        data["gateway_latency"] = self.app.probe_latency(data["gateway"]) if data["gateway"] else None
+        data["gateway_reachable"] = bool(data["gateway_latency"] and data["gateway_latency"]["received"])
+        try:
+            socket.getaddrinfo(request.get("dns_test_host", "www.baidu.com"), 443)
+            data["dns_ok"] = True
+        except OSError:
+            data["dns_ok"] = False
+        ok = data["gateway_reachable"] and data["dns_ok"]
+        message = f"网关{'正常' if data['gateway_reachable'] else '异常'}，DNS{'正常' if data['dns_ok'] else '异常'}"
+        return {"ok": ok, "message": message, "data": data}
+
+class FleetController:
+    """控制端：并发向多台代理下发命令并汇总结果"""
+    def __init__(self, hosts, concurrency=10, timeout=30.0, token=""):
+        self.hosts = hosts
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.token = token
+
+    @staticmethod
+    def parse_host(host):
+        """解析 host[:port]，IPv6地址使用 [addr]:port 形式"""
+        host = host.strip()
+        if host.startswith('['):
+            address, _, port = host[1:].partition(']')
+            return address, int(port.lstrip(':') or FLEET_PORT)
+        if host.count(':') == 1:
+            address, port = host.split(':')
+            return address, int(port)
+        return host, FLEET_PORT
+
+    async def send(self, host, request):
+        """向一台代理发送请求，返回带主机名和耗时的结果"""
+        import asyncio
+        import time
+        start = time.perf_counter()
+        result = {"host": host, "ok": False, "message": "", "data": {}}
+        writer = None
+        try:
+            address, port = self.parse_host(host)
+
+            async def exchange():
+                nonlocal writer
+                reader, writer = await asyncio.open_connection(address, port)
+                writer.write((json.dumps(request, ensure_ascii=False) + "\n").encode('utf-8'))
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("代理关闭了连接")
+                return json.loads(line.decode('utf-8'))
+
+            result.update(await asyncio.wait_for(exchange(), self.timeout))
+        except asyncio.TimeoutError:
+            result["message"] = f"超时（{self.timeout}秒）"
+        except (OSError, ValueError) as e:
+            result["message"] = f"连接失败: {e}"
+        finally:
+            if writer is not None:
+                writer.close()
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def run(self, command, **params):
+        """向所有代理并发发送命令（最多 concurrency 个同时进行），按主机顺序返回结果"""
+        import asyncio
+        semaphore = asyncio.Semaphore(self.concurrency)
+        request = dict(params, command=command, token=self.token)
+
+        async def limited(host):
+            async with semaphore:
+                return await self.send(host, request)
+
+        return await asyncio.gather(*(limited(host) for host in self.hosts))
+
+    @staticmethod
+    def summarize(results):
+        """生成结果汇总文本"""
+        lines = [f"{'OK ' if r['ok'] else 'ERR'} {r['host']:<24} {r['latency_ms']:>8.1f} ms  {r['message']}" for r in results]
+        succeeded = sum(1 for r in results if r["ok"])
+        latencies = sorted(r["latency_ms"] for r in results)
+        if latencies:
+            lines.append(f"成功 {succeeded}/{len(results)}，耗时 最小 {latencies[0]} ms / "
+                         f"中位 {latencies[len(latencies) // 2]} ms / 最大 {latencies[-1]} ms")
+        return "\n".join(lines)
+
 class AddEditIPConfigDialog:
     def __init__(self, parent, app, title, ip_config=None, index=None):
         self.parent = parent
@@ -829,32 +3457,10 @@ class AddEditIPConfigDialog:
             messagebox.showwarning("警告", "请填写所有必需字段！")
             return
         
-        # 验证IP地址格式
-        if not self.is_valid_ip(ip):
-            messagebox.showerror("错误", "IP地址格式不正确！\n请输入有效的IPv4地址，如192.168.1.100")
-            return
-        
-        if not self.is_valid_ip(subnet):
-            messagebox.showerror("错误", "子网掩码格式不正确！\n请输入有效的子网掩码，如255.255.255.0")
-            return
-            
-        # 验证子网掩码是否为有效值
-        if not self.is_valid_subnet(subnet):
-            messagebox.showerror("错误", "子网掩码值无效！\n请输入标准的子网掩码值")
-            return
-        
-        if not self.is_valid_ip(gateway):
-            messagebox.showerror("错误", "网关地址格式不正确！\n请输入有效的网关地址，如192.168.1.1")
-            return
-            
-        # 如果提供了DNS，验证其格式
-        if dns and not self.is_valid_ip(dns):
-            messagebox.showerror("错误", "DNS服务器地址格式不正确！\n请输入有效的DNS地址，如8.8.8.8")
-            return
-        
-        # 验证网关是否在子网内
-        if not self.is_gateway_in_subnet(ip, subnet, gateway):
-            messagebox.showerror("错误", "网关地址不在当前子网内！\n请检查IP地址和网关设置")
+        # 验证IP地址、子网掩码、网关和DNS
+        error_msg = check_ip_config({"ip": ip, "subnet": subnet, "gateway": gateway, "dns": dns})
+        if error_msg:
+            messagebox.showerror("错误", error_msg)
             return
         
         # 检查配置名称是否已存在
@@ -879,82 +3485,281 @@ class AddEditIPConfigDialog:
     def cancel(self):
         """取消按钮处理"""
         self.dialog.destroy()
+
+class RangeTemplateDialog:
+    """添加/编辑范围模板的对话框"""
+    def __init__(self, parent, app, title, entry=None, index=None):
+        self.parent = parent
+        self.app = app
+        self.entry = entry or {"type": "template", "name": "", "ip": "", "ip_end": "", "subnet": "255.255.255.0",
+                               "gateway": "", "dns": "8.8.8.8", "name_pattern": ""}
+        self.index = index
+        
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(title)
+        self.dialog.geometry("420x330")
+        self.dialog.resizable(False, False)
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        
+        # 居中显示
+        self.dialog.geometry("+%d+%d" % (parent.winfo_rootx() + 50, parent.winfo_rooty() + 50))
+        
+        self.setup_dialog()
     
-    def is_valid_ip(self, ip):
-        """验证IP地址格式"""
-        try:
-            # 使用更严格的IP地址验证
-            parts = ip.split('.')
-            if len(parts) != 4:
-                return False
-            for part in parts:
-                # 检查每部分是否为数字且在0-255范围内
-                if not part.isdigit() or not 0 <= int(part) <= 255:
-                    return False
-            # 不允许以0开头的非零数字（如01, 001等）
-            if any(part != '0' and part.startswith('0') for part in parts):
-                return False
-            return True
-        except:
-            return False
+    def setup_dialog(self):
+        """设置对话框界面"""
+        main_frame = ttk.Frame(self.dialog, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        fields = [("name", "模板名称:"), ("ip", "起始地址:"), ("ip_end", "结束地址:"), ("subnet", "子网掩码:"),
+                  ("gateway", "网关:"), ("dns", "DNS服务器:"), ("name_pattern", "名称模式:")]
+        self.vars = {}
+        for row, (key, label) in enumerate(fields):
+            ttk.Label(main_frame, text=label).grid(row=row, column=0, sticky=tk.W, pady=5)
+            self.vars[key] = tk.StringVar(value=self.entry.get(key, ""))
+            ttk.Entry(main_frame, textvariable=self.vars[key], width=30).grid(row=row, column=1, pady=5, padx=(10, 0))
+        
+        # 名称模式说明
+        ttk.Label(main_frame, text="名称模式可用 {n}（序号）和 {ip}（地址），留空时为 模板名称-{n}",
+                  font=("Arial", 8)).grid(row=len(fields), column=0, columnspan=2, pady=(0, 10))
+        
+        # 按钮
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=len(fields) + 1, column=0, columnspan=2, pady=10)
+        ttk.Button(button_frame, text="确定", command=self.ok).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        # 绑定回车键
+        self.dialog.bind('<Return>', lambda event: self.ok())
+        self.dialog.bind('<Escape>', lambda event: self.dialog.destroy())
+    
+    def ok(self):
+        """确定按钮处理"""
+        new_entry = {"type": "template"}
+        new_entry.update({key: var.get().strip() for key, var in self.vars.items()})
+        
+        if not all(new_entry[key] for key in ("name", "ip", "ip_end", "subnet", "gateway")):
+            messagebox.showwarning("警告", "请填写所有必需字段！")
+            return
+        
+        # 验证地址范围、子网、网关和名称模式
+        error_msg = check_ip_config(new_entry)
+        if error_msg:
+            messagebox.showerror("错误", error_msg)
+            return
+        
+        # 检查配置名称是否已存在
+        if self.index is None:
+            for config in self.app.config["virtual_ips"]:
+                if config["name"] == new_entry["name"]:
+                    messagebox.showwarning("警告", f"配置名称 '{new_entry['name']}' 已存在！\n请使用不同的名称")
+                    return
+        
+        self.app.update_ip_config_list(new_entry, self.index)
+        self.dialog.destroy()
+
+class LogViewerDialog:
+    """日志查看器：按级别、配置名称（关键字）和时间筛选所有轮转日志，分页显示并跟踪最新内容"""
+    PAGE_SIZE = 200
+    LEVEL_CHOICES = {"全部": 0, "INFO": 2, "WARNING": 3, "ERROR": 4}
+    LEVEL_TAGS = {3: "warning", 4: "error", 5: "error"}
+
+    def __init__(self, parent, app):
+        self.parent = parent
+        self.app = app
+        self.index = LogIndex()
+        self.results = []
+        self.filters = {}
+        self.page = 0
+        
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("日志查看器")
+        self.dialog.geometry("780x520")
+        self.dialog.transient(parent)
+        
+        # 居中显示
+        self.dialog.geometry("+%d+%d" % (parent.winfo_rootx() + 50, parent.winfo_rooty() + 50))
+        
+        self.setup_dialog()
+        self.index.refresh()
+        self.apply_filter()
+        self.dialog.after(self.app.config.get("log_tail_interval_ms", 1000), self.tail)
     
-    def is_valid_subnet(self, subnet):
-        """验证子网掩码是否有效"""
+    def setup_dialog(self):
+        """设置对话框界面"""
+        filter_frame = ttk.Frame(self.dialog, padding="5")
+        filter_frame.pack(fill=tk.X)
+        
+        ttk.Label(filter_frame, text="级别:").pack(side=tk.LEFT)
+        self.level_var = tk.StringVar(value="全部")
+        ttk.Combobox(filter_frame, textvariable=self.level_var, values=list(self.LEVEL_CHOICES),
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(filter_frame, text="配置/关键字:").pack(side=tk.LEFT)
+        self.keyword_var = tk.StringVar()
+        ttk.Combobox(filter_frame, textvariable=self.keyword_var, width=16,
+                     values=[c["name"] for c in self.app.config["virtual_ips"]]).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(filter_frame, text="时间:").pack(side=tk.LEFT)
+        self.start_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.start_var, width=17).pack(side=tk.LEFT)
+        ttk.Label(filter_frame, text="~").pack(side=tk.LEFT)
+        self.end_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.end_var, width=17).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(filter_frame, text="筛选", command=self.apply_filter).pack(side=tk.LEFT)
+        self.dialog.bind('<Return>', lambda event: self.apply_filter())
+        
+        text_frame = ttk.Frame(self.dialog)
+        text_frame.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.text = tk.Text(text_frame, wrap=tk.NONE, state=tk.DISABLED, font=("Consolas", 9))
+        y_scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.text.yview)
+        x_scrollbar = ttk.Scrollbar(text_frame, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(yscrollcommand=y_scrollbar.set, xscrollcommand=x_scrollbar.set)
+        y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure("warning", foreground="#c07000")
+        self.text.tag_configure("error", foreground="red")
+        
+        nav_frame = ttk.Frame(self.dialog, padding="5")
+        nav_frame.pack(fill=tk.X)
+        ttk.Button(nav_frame, text="最早", command=lambda: self.show_page(0)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(nav_frame, text="上一页", command=lambda: self.show_page(self.page - 1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(nav_frame, text="下一页", command=lambda: self.show_page(self.page + 1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(nav_frame, text="最新", command=lambda: self.show_page(self.page_count() - 1)).pack(side=tk.LEFT, padx=2)
+        self.follow_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(nav_frame, text="跟踪最新日志", variable=self.follow_var).pack(side=tk.LEFT, padx=10)
+        self.page_label = ttk.Label(nav_frame, text="")
+        self.page_label.pack(side=tk.RIGHT)
+    
+    def page_count(self):
+        """总页数（至少1页）"""
+        return max(1, (len(self.results) + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+    
+    def apply_filter(self):
+        """按当前条件筛选，显示最新的一页"""
         try:
-            parts = subnet.split('.')
-            if len(parts) != 4:
-                return False
-            # 常见的子网掩码值
-            valid_masks = [
-                "255.255.255.255", "255.255.255.254", "255.255.255.252", "255.255.255.248",
-                "255.255.255.240", "255.255.255.224", "255.255.255.192", "255.255.255.128",
-                "255.255.255.0", "255.255.254.0", "255.255.252.0", "255.255.248.0",
-                "255.255.240.0", "255.255.224.0", "255.255.192.0", "255.255.128.0",
-                "255.255.0.0", "255.254.0.0", "255.252.0.0", "255.248.0.0",
-                "255.240.0.0", "255.224.0.0", "255.192.0.0", "255.128.0.0",
-                "255.0.0.0", "254.0.0.0", "252.0.0.0", "248.0.0.0",
-                "240.0.0.0", "224.0.0.0", "192.0.0.0", "128.0.0.0", "0.0.0.0"
-            ]
-            return subnet in valid_masks
-        except:
-            return False
+            self.filters = {
+                "min_level": self.LEVEL_CHOICES[self.level_var.get()],
+                "start": LogIndex.time_key(self.start_var.get()),
+                "end": LogIndex.time_key(self.end_var.get(), upper=True),
+                "keyword": self.keyword_var.get().strip()
+            }
+        except ValueError as e:
+            messagebox.showerror("错误", str(e), parent=self.dialog)
+            return
+        self.results = self.index.query(**self.filters)
+        self.show_page(self.page_count() - 1)
     
-    def is_gateway_valid(self, ip, gateway):
-        """验证网关是否在IP的子网内"""
+    def show_page(self, page):
+        """显示指定页（只把这一页的记录放进文本框）"""
+        self.page = min(max(page, 0), self.page_count() - 1)
+        refs = self.results[self.page * self.PAGE_SIZE:(self.page + 1) * self.PAGE_SIZE]
         try:
-            ip_parts = [int(x) for x in ip.split('.')]
-            gateway_parts = [int(x) for x in gateway.split('.')]
-            
-            # 检查IP和网关是否在同一子网内（基本检查）
-            for i in range(4):
-                if ip_parts[i] != gateway_parts[i]:
-                    # 如果IP和网关的某一位不同，检查是否在同一子网内
-                    break
-            return True  # 简单检查，实际应用中可能需要更复杂的逻辑
-        except:
-            return False
+            lines = LogIndex.read(refs)
+        except (OSError, ValueError):
+            # 日志刚好轮转，重新索引后再显示
+            self.index.refresh()
+            self.results = self.index.query(**self.filters)
+            self.page = min(self.page, self.page_count() - 1)
+            refs = self.results[self.page * self.PAGE_SIZE:(self.page + 1) * self.PAGE_SIZE]
+            lines = LogIndex.read(refs)
+        
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        for level, text in lines:
+            self.text.insert(tk.END, text + "\n", self.LEVEL_TAGS.get(level, ""))
+        self.text.config(state=tk.DISABLED)
+        if self.page == self.page_count() - 1:
+            self.text.see(tk.END)
+        self.update_page_label()
+    
+    def update_page_label(self):
+        """更新页码提示"""
+        self.page_label.config(text=f"第 {self.page + 1}/{self.page_count()} 页，共 {len(self.results)} 条记录")
     
-    def is_gateway_in_subnet(self, ip, subnet, gateway):
-        """检查网关是否在IP和子网掩码定义的子网内"""
+    def tail(self):
+        """增量索引新写入的日志；停留在最后一页且勾选跟踪时自动显示新内容"""
+        if not self.dialog.winfo_exists():
+            return
         try:
-            # 将IP、子网掩码和网关转换为整数
-            def ip_to_int(ip_str):
-                parts = ip_str.split('.')
-                return (int(parts[0]) << 24) + (int(parts[1]) << 16) + (int(parts[2]) << 8) + int(parts[3])
-            
-            ip_int = ip_to_int(ip)
-            subnet_int = ip_to_int(subnet)
-            gateway_int = ip_to_int(gateway)
-            
-            # 计算网络地址
-            network_address = ip_int & subnet_int
-            broadcast_address = ip_int | (0xFFFFFFFF ^ subnet_int)
-            
-            # 检查网关是否在网络范围内
-            return network_address <= gateway_int <= broadcast_address
-        except:
-            return False
+            at_end = self.page == self.page_count() - 1
+            if self.index.refresh():
+                self.results = self.index.query(**self.filters)
+                if at_end and self.follow_var.get():
+                    self.show_page(self.page_count() - 1)
+                else:
+                    self.update_page_label()
+        except (OSError, ValueError) as e:
+            self.app.log_error(f"刷新日志索引时发生错误: {e}")
+        finally:
+            self.dialog.after(self.app.config.get("log_tail_interval_ms", 1000), self.tail)
+
+def main():
+    """命令行入口：默认启动图形界面，也可运行代理或控制端"""
+    import argparse
+    import asyncio
+    parser = argparse.ArgumentParser(description="虚拟IP切换器")
+    parser.add_argument("--config", default="virtual_ip_config.json", help="配置文件路径")
+    parser.add_argument("--agent", action="store_true", help="以代理模式运行（无界面），接收控制端命令")
+    parser.add_argument("--listen", default="0.0.0.0", help="代理监听地址")
+    parser.add_argument("--port", type=int, default=FLEET_PORT, help="代理监听端口")
+    parser.add_argument("--fake-backend", action="store_true", help="使用模拟后端，不修改系统网络配置")
+    parser.add_argument("--token", default="", help="代理与控制端之间的共享口令")
+    parser.add_argument("--fleet", metavar="HOSTS", help="控制端模式：主机列表文件，或逗号分隔的 host[:port]")
+    parser.add_argument("command", nargs="?", choices=["apply", "status", "diagnose"], default="status",
+                        help="控制端下发的命令")
+    parser.add_argument("--profile", default="", help="apply 命令要应用的配置名称")
+    parser.add_argument("--ip", default="", help="apply 范围模板时要应用的地址")
+    parser.add_argument("--force", action="store_true", help="apply 时忽略IP冲突检查")
+    parser.add_argument("--concurrency", type=int, default=10, help="控制端最大并发数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="控制端单台主机超时（秒）")
+    parser.add_argument("--record-trace", metavar="PATH", help="将执行的命令和操作记录到跟踪文件（.trace.gz）")
+    parser.add_argument("--replay-trace", metavar="PATH", help="离线回放跟踪文件并输出耗时对比")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="回放速度倍数，0 表示不等待")
+    args = parser.parse_args()
+    if args.agent and not args.token and not is_loopback_address(args.listen):
+        parser.error("代理监听非本机地址时必须使用 --token 设置口令（仅本机测试可使用 --listen 127.0.0.1）")
+
+    if args.replay_trace:
+        report, backend = replay_trace(args.replay_trace, args.replay_speed)
+        for row in report:
+            print(f"{'OK ' if row['ok'] else 'ERR'} {row['name']:<24} 记录 {row['recorded_ms']:>9.1f} ms  "
+                  f"回放 {row['replayed_ms']:>9.1f} ms")
+        for actual, expected in backend.mismatches:
+            print(f"命令不一致: 实际 {actual!r}，记录 {expected!r}")
+        print(f"共回放 {len(report)} 个操作，{sum(1 for row in report if not row['ok'])} 个不一致，"
+              f"{backend.unowned} 条命令不属于可回放的操作")
+        sys.exit(0 if all(row["ok"] for row in report) else 1)
+
+    if args.fleet:
+        if os.path.exists(args.fleet):
+            with open(args.fleet, 'r', encoding='utf-8') as f:
+                hosts = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        else:
+            hosts = [host for host in args.fleet.split(',') if host.strip()]
+        controller = FleetController(hosts, args.concurrency, args.timeout, args.token)
+        results = asyncio.run(controller.run(args.command, profile=args.profile, ip=args.ip, force=args.force))
+        print(FleetController.summarize(results))
+        sys.exit(0 if all(r["ok"] for r in results) else 1)
+    backend = FakeBackend() if args.fake_backend else CommandBackend()
+    if args.record_trace:
+        backend = TraceRecorder(backend, args.record_trace)
+    app = VirtualIPSwitcher(headless=args.agent, backend=backend, config_file=args.config)
+    if args.record_trace:
+        backend.attach(app)
+        app.log_info(f"正在记录跟踪文件: {args.record_trace}")
+    try:
+        if args.agent:
+            agent = FleetAgent(app, args.listen, args.port, args.token)
+            try:
+                asyncio.run(agent.serve_forever())
+            except KeyboardInterrupt:
+                app.log_info("代理已退出")
+        else:
+            app.run()
+    finally:
+        if args.record_trace:
+            backend.close()
 
 if __name__ == "__main__":
-    app = VirtualIPSwitcher()
-    app.run()
\ No newline at end of file
+    main()
\ No newline at end of file